@@ -11,62 +11,65 @@
 # Each module is designed to work independently or as part of the pipeline.
 
 import logging
+import sys
+from typing import TYPE_CHECKING, Dict, Tuple
 
-# Set up logging
-logging.basicConfig(level=logging.INFO,
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Library logging: leave root configuration to the application
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
-# Import modules to make them available when importing the package
-try:
-    from .transcription import WhisperTranscriber
-    logger.info("Successfully imported WhisperTranscriber")
-except ImportError as e:
-    logger.warning(f"Failed to import WhisperTranscriber: {e}")
-    pass
+# Map public names to the submodules that define them. Submodules pull in
+# heavy dependencies (torch, transformers, pyannote, yt-dlp), so they are
+# only imported on first attribute access (PEP 562). Treat as read-only.
+_LAZY: Dict[str, Tuple[str, str]] = {
+    "WhisperTranscriber": (".transcription", "WhisperTranscriber"),
+    "SpeakerDiarization": (".diarization", "SpeakerDiarization"),
+    "ExtractiveSummarizer": (".summarization", "ExtractiveSummarizer"),
+    "AbstractiveSummarizer": (".summarization", "AbstractiveSummarizer"),
+    "TopicDetector": (".topic_detection", "TopicDetector"),
+    "AudioProcessor": (".audio_processing", "AudioProcessor"),
+    "YouTubeDownloader": (".youtube_downloader", "YouTubeDownloader"),
+}
 
-try:
+if TYPE_CHECKING:
+    from .transcription import WhisperTranscriber
     from .diarization import SpeakerDiarization
-    logger.info("Successfully imported SpeakerDiarization")
-except ImportError as e:
-    logger.warning(f"Failed to import SpeakerDiarization: {e}")
-    pass
-
-try:
     from .summarization import ExtractiveSummarizer, AbstractiveSummarizer
-    logger.info("Successfully imported Summarizers")
-except ImportError as e:
-    logger.warning(f"Failed to import Summarizers: {e}")
-    pass
-
-try:
     from .topic_detection import TopicDetector
-    logger.info("Successfully imported TopicDetector")
-except ImportError as e:
-    logger.warning(f"Failed to import TopicDetector: {e}")
-    pass
-
-try:
     from .audio_processing import AudioProcessor
-    logger.info("Successfully imported AudioProcessor")
-except ImportError as e:
-    logger.warning(f"Failed to import AudioProcessor: {e}")
-    pass
-
-try:
     from .youtube_downloader import YouTubeDownloader
-    logger.info("Successfully imported YouTubeDownloader")
-except ImportError as e:
-    logger.warning(f"Failed to import YouTubeDownloader: {e}")
-    pass
+
+
+def __getattr__(name):
+    """Import the submodule providing ``name`` on first access."""
+    if name in _LAZY:
+        import importlib
+        module_name, attr = _LAZY[name]
+        try:
+            module = importlib.import_module(module_name, __name__)
+        except ImportError as e:
+            logger.warning("Failed to import %s: %s", name, e)
+            raise
+        value = getattr(module, attr)
+        # Install into the module dict so later lookups skip __getattr__
+        sys.modules[__name__].__dict__[name] = value
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Lazily imported %s", name)
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Define what's available when doing "from backend import *"
-__all__ = [
+__all__ = (
     'WhisperTranscriber',
     'SpeakerDiarization',
     'ExtractiveSummarizer',
     'AbstractiveSummarizer',
     'TopicDetector',
     'AudioProcessor',
-    'YouTubeDownloader'
-] 
+    'YouTubeDownloader',
+)
+
+def __dir__():
+    # Real module attributes plus the lazily loaded names not imported yet
+    return sorted(set(globals()) | set(__all__))
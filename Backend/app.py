@@ -1,21 +1,32 @@
-﻿from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+﻿from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, FileResponse, RedirectResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import Optional, Dict, Union, Any
+from typing import Optional, Dict, Union, Any, Tuple, Set
 
 # Standard library imports
 import os
 import sys
 import logging
 from pathlib import Path
-from contextlib import contextmanager
-import signal
-import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import json
+import asyncio
+import hashlib
+import mimetypes
+import functools
+import importlib
+import uuid
+import contextlib
+import threading
 
 # Third-party imports
 from dotenv import load_dotenv
+import orjson
+import msgpack
+import aiofiles
 
 # Add the backend directory to the path if needed
 current_dir = Path(__file__).parent
@@ -32,6 +43,12 @@ warnings.filterwarnings("ignore", message="torchaudio.backend.common.AudioMetaDa
 # Initialize environment
 load_dotenv()
 
+# Keep downloaded Hugging Face models in a persistent location so restarts
+# don't re-download them; this must be set before transformers is imported
+MODEL_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR")
+if MODEL_CACHE_DIR:
+    os.environ.setdefault("HUGGINGFACE_HUB_CACHE", MODEL_CACHE_DIR)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -49,32 +66,50 @@ except ImportError:
     except Exception as e:
         logger.error(f"Failed to download NLTK data: {str(e)}")
 
-# Import all processors
-try:
-    from transcription import WhisperTranscriber
-    from diarization import SpeakerDiarization
-    from summarization import ExtractiveSummarizer, AbstractiveSummarizer
-    from topic_detection import TopicDetector
-    from audio_processing import AudioProcessor
-    from youtube_downloader import YouTubeDownloader
-    logger.info("Imported processors successfully")
-except ImportError:
+# Processor classes are imported on first use: their modules pull in torch,
+# transformers and pyannote, which would otherwise slow down every worker start
+PROCESSOR_MODULES = {
+    "WhisperTranscriber": "transcription",
+    "SpeakerDiarization": "diarization",
+    "ExtractiveSummarizer": "summarization",
+    "AbstractiveSummarizer": "summarization",
+    "TopicDetector": "topic_detection",
+    "AudioProcessor": "audio_processing",
+    "YouTubeDownloader": "youtube_downloader",
+    "GPUWorker": "gpu_worker",
+}
+
+@functools.cache
+def get_processor_class(name):
+    """Import and return a processor class by name."""
+    module_name = PROCESSOR_MODULES[name]
     try:
-        from backend.transcription import WhisperTranscriber
-        from backend.diarization import SpeakerDiarization
-        from backend.summarization import ExtractiveSummarizer, AbstractiveSummarizer
-        from backend.topic_detection import TopicDetector
-        from backend.audio_processing import AudioProcessor
-        from backend.youtube_downloader import YouTubeDownloader
-        logger.info("Imported processors successfully")
-    except ImportError as e:
-        logger.error(f"Failed to import processors: {str(e)}")
-        raise
+        module = importlib.import_module(module_name)
+    except ImportError:
+        try:
+            module = importlib.import_module(f"backend.{module_name}")
+        except ImportError as e:
+            logger.error(f"Failed to import processors: {str(e)}")
+            raise
+    return getattr(module, name)
 
 # Create uploads directory
 UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", "./uploads"))
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Size of the chunks used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MB
+
+# Job results are stored as msgpack, which is smaller and faster to parse
+# than JSON for transcripts with thousands of segments
+RESULTS_SUFFIX = "_results.msgpack"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Parsed results keyed by job ID, stored with the file mtime they were read at
+RESULTS_CACHE_SIZE = int(os.environ.get("RESULTS_CACHE_SIZE", 128))
+RESULTS_CACHE: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+RESULTS_CACHE_LOCK = asyncio.Lock()
+
 # Check for Hugging Face access token
 HF_ACCESS_TOKEN = os.environ.get("HF_ACCESS_TOKEN")
 if not HF_ACCESS_TOKEN or HF_ACCESS_TOKEN == "your_huggingface_token_here":
@@ -86,7 +121,8 @@ if not HF_ACCESS_TOKEN or HF_ACCESS_TOKEN == "your_huggingface_token_here":
 app = FastAPI(
     title="Podcast Processing API",
     description="API for podcast transcription, summarization, and analysis",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -99,15 +135,47 @@ if "*" in ALLOWED_ORIGINS:
     logger.warning("This is not recommended for production environments")
     logger.warning("Set ALLOWED_ORIGINS env var to a comma-separated list of allowed origins")
 
+# Let browsers cache preflight responses (Chrome caps this at 2 hours) so
+# polling the API doesn't cost an OPTIONS request per fetch
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", 86400))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,  # Use specific origins rather than wildcard
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Accept", "Content-Type", "Range"],
+    max_age=CORS_MAX_AGE,
+)
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZip middleware that leaves the listed path prefixes and suffixes uncompressed."""
+    def __init__(self, app, exclude_prefixes=(), exclude_suffixes=(), **kwargs):
+        super().__init__(app, **kwargs)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.exclude_suffixes = tuple(exclude_suffixes)
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["path"].startswith(self.exclude_prefixes)
+                                        or scope["path"].endswith(self.exclude_suffixes)):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Compress JSON responses (transcripts compress well); audio is already
+# compressed and is served with byte ranges, so it is sent as-is, as are
+# event streams, which must not be buffered
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    exclude_prefixes=("/api/audio/",),
+    exclude_suffixes=("/stream",),
+    minimum_size=1024,
+    compresslevel=5
 )
 
 # Define response models
+# Endpoints below return ORJSONResponse directly, so these models document
+# the responses without re-validating them on every request
 class ProcessingResponse(BaseModel):
     """Response model for processing results."""
     message: str
@@ -121,68 +189,393 @@ class ProcessResponse(BaseModel):
     file_name: str
     error: Optional[str] = None
 
-# Timeout handler for long-running operations
-class TimeoutError(Exception):
-    pass
+# Thread pool for blocking processor calls made from async code
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("EXECUTOR_WORKERS", 4)))
+
+async def run_blocking(func, *args):
+    """Run a blocking call in the shared executor without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, func, *args)
 
-@contextmanager
-def time_limit(seconds):
+async def run_blocking_locked(lock, timeout, func, *args):
     """
-    Context manager for setting a timeout on operations - platform independent version.
-    Uses SIGALRM on Unix systems and threading on Windows.
+    Run a blocking call in the shared executor while holding an asyncio lock,
+    giving up waiting after timeout seconds. A thread cannot be cancelled, so
+    a timed-out call keeps the lock until it actually returns and the next
+    caller never runs the same model concurrently with it.
     """
-    # Check if running on Windows or Unix
-    is_windows = sys.platform.startswith('win')
+    await lock.acquire()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(EXECUTOR, func, *args)
+    except BaseException:
+        lock.release()
+        raise
     
-    if not is_windows and seconds > 0:
-        # Use SIGALRM on Unix systems
-        def signal_handler(signum, frame):
-            raise TimeoutError(f"Operation timed out after {seconds} seconds")
-            
-        signal.signal(signal.SIGALRM, signal_handler)
-        signal.alarm(seconds)
-        try:
-            yield
-        finally:
-            signal.alarm(0)
-    else:
-        # On Windows, use threading with a timer
-        timer = None
-        timeout_occurred = False
-        current_thread = threading.current_thread()
-        
-        def timeout_handler():
-            nonlocal timeout_occurred
-            timeout_occurred = True
-            # Raise an exception in the main thread (not foolproof but works for many cases)
-            logging.error(f"Operation timed out after {seconds} seconds")
-        
-        if seconds > 0:
-            timer = threading.Timer(seconds, timeout_handler)
-            timer.daemon = True
-            timer.start()
-        
-        try:
-            yield
-            # Periodically check if timeout occurred
-            if timeout_occurred:
-                raise TimeoutError(f"Operation timed out after {seconds} seconds")
-        finally:
-            if timer:
-                timer.cancel()
+    def release(done):
+        lock.release()
+        # Retrieve the outcome of a call nobody waits on any more
+        if not done.cancelled():
+            done.exception()
+    
+    future.add_done_callback(release)
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
 
 # Get timeouts from environment variables
 DIARIZATION_TIMEOUT = int(os.environ.get("DIARIZATION_TIMEOUT", 300))  # 5 minutes default
 TOPIC_DETECTION_TIMEOUT = int(os.environ.get("TOPIC_DETECTION_TIMEOUT", 120))  # 2 minutes default
 SUMMARIZATION_TIMEOUT = int(os.environ.get("SUMMARIZATION_TIMEOUT", 60))  # 1 minute default
 
+# Whisper model size for the shared transcriber
+WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "base")
+
+# Run Whisper and pyannote in a dedicated worker process instead of in the API process
+USE_GPU_WORKER = os.environ.get("USE_GPU_WORKER", "false").lower() == "true"
+
+# Run extractive summarization and topic detection in a process pool so jobs
+# can use several cores; CPU_POOL_WORKERS defaults to one less than the CPU count
+USE_CPU_POOL = os.environ.get("USE_CPU_POOL", "false").lower() == "true"
+CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", 0)) or None
+
+# Job batching: wait up to JOB_BATCH_MAX_WAIT seconds for up to JOB_BATCH_MAX_SIZE jobs
+JOB_BATCH_MAX_WAIT = float(os.environ.get("JOB_BATCH_MAX_WAIT", 0.2))
+JOB_BATCH_MAX_SIZE = int(os.environ.get("JOB_BATCH_MAX_SIZE", 8))
+
+# Job status store: Redis when REDIS_URL is set, so every API worker sees the
+# same progress; otherwise an in-process dict holding only unfinished jobs
+REDIS_URL = os.environ.get("REDIS_URL")
+JOB_STATUS_TTL = int(os.environ.get("JOB_STATUS_TTL", 86400))  # 1 day default
+JOB_STATUS: Dict[str, Dict[str, Any]] = {}
+# Without Redis, IDs of uploaded jobs that are queued, running or finished
+# successfully. Claimed synchronously so concurrent identical uploads queue once
+JOB_CLAIMS: Set[str] = set()
+# Without Redis, stage updates are pushed to these per-job event stream queues
+JOB_SUBSCRIBERS: Dict[str, Set[asyncio.Queue]] = {}
+
+# Seconds between keep-alive comments on idle job event streams
+JOB_STREAM_KEEPALIVE = float(os.environ.get("JOB_STREAM_KEEPALIVE", 15))
+JOB_FINAL_STAGES = ("done", "error")
+
+# Shared processors, created once per process and reused by every job. A
+# failed initialization is retried on the next call.
+@functools.cache
+def get_audio_processor():
+    return get_processor_class("AudioProcessor")()
+
+# The GPU worker is kept only once it started, so a failed start is retried
+_gpu_worker = None
+_gpu_worker_lock = threading.Lock()
+
+def get_gpu_worker():
+    """Start the GPU worker process, or return None if it cannot be started."""
+    global _gpu_worker
+    with _gpu_worker_lock:
+        if _gpu_worker is not None:
+            return _gpu_worker
+        gpu_worker = get_processor_class("GPUWorker")(
+            whisper_model_size=WHISPER_MODEL_SIZE, auth_token=HF_ACCESS_TOKEN)
+        try:
+            gpu_worker.start()
+        except Exception as e:
+            logger.error(f"Error starting GPU worker, using in-process models: {str(e)}")
+            return None
+        _gpu_worker = gpu_worker
+        return gpu_worker
+
+@functools.cache
+def _get_local_transcriber():
+    return get_processor_class("WhisperTranscriber")(model_size=WHISPER_MODEL_SIZE)
+
+@functools.cache
+def _get_local_diarizer():
+    return get_processor_class("SpeakerDiarization")(use_auth_token=HF_ACCESS_TOKEN)
+
+def get_transcriber():
+    # The GPU worker serves both transcription and diarization requests
+    if USE_GPU_WORKER and get_gpu_worker():
+        return get_gpu_worker()
+    return _get_local_transcriber()
+
+def get_diarizer():
+    if USE_GPU_WORKER and get_gpu_worker():
+        return get_gpu_worker()
+    return _get_local_diarizer()
+
+@functools.cache
+def get_topic_detector():
+    return get_processor_class("TopicDetector")()
+
+@functools.cache
+def get_extractive_summarizer():
+    return get_processor_class("ExtractiveSummarizer")()
+
+@functools.cache
+def get_abstractive_summarizer():
+    return get_processor_class("AbstractiveSummarizer")()
+
+@functools.cache
+def get_cpu_worker():
+    """Import the CPU worker module, whose functions are sent to the process pool."""
+    try:
+        return importlib.import_module("cpu_worker")
+    except ImportError:
+        return importlib.import_module("backend.cpu_worker")
+
+@functools.cache
+def get_cpu_pool():
+    """Create the CPU process pool, or return None if it cannot be created."""
+    try:
+        return get_cpu_worker().create_cpu_pool(CPU_POOL_WORKERS)
+    except Exception as e:
+        logger.error(f"Error creating CPU process pool, using in-process models: {str(e)}")
+        return None
+
+# CPU-bound analysis steps: the shared processor used in-process and the
+# method to call on it; the CPU worker module has a function of the same name
+CPU_TASKS = {
+    "extractive_summarize": (get_extractive_summarizer, "summarize"),
+    "detect_topics": (get_topic_detector, "detect_topics"),
+}
+
+async def run_cpu_task(name, transcript, lock=None, timeout=None):
+    """
+    Run a CPU-bound analysis step in the process pool when it is enabled,
+    otherwise on the shared in-process processor (holding lock, if given),
+    giving up after timeout seconds.
+    """
+    if USE_CPU_POOL and get_cpu_pool():
+        func = getattr(get_cpu_worker(), name)
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(get_cpu_pool(), func, transcript), timeout)
+    
+    getter, method = CPU_TASKS[name]
+    processor = await run_blocking(getter)
+    if lock is None:
+        return await asyncio.wait_for(run_blocking(getattr(processor, method), transcript), timeout)
+    return await run_blocking_locked(lock, timeout, getattr(processor, method), transcript)
+
+def _warm_up_processors():
+    """Create the shared processors so the first job doesn't pay for it."""
+    getters = [
+        ("audio processor", get_audio_processor),
+        ("transcriber", get_transcriber),
+        ("abstractive summarizer", lambda: get_abstractive_summarizer().preload()),
+    ]
+    if USE_CPU_POOL:
+        getters.append(("CPU process pool", get_cpu_pool))
+    else:
+        getters.append(("topic detector", get_topic_detector))
+        getters.append(("extractive summarizer", get_extractive_summarizer))
+    if HF_ACCESS_TOKEN:
+        getters.append(("diarizer", get_diarizer))
+    
+    for name, getter in getters:
+        try:
+            getter()
+            logger.info(f"Shared {name} initialized")
+        except Exception as e:
+            logger.error(f"Error initializing shared {name}: {str(e)}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Start loading shared processors and start the background job worker."""
+    # Load processors in the background so the API can serve requests
+    # immediately; the job worker waits for this before its first batch
+    app.state.warm_up = asyncio.create_task(run_blocking(_warm_up_processors))
+    
+    # Serialize access to GPU-backed models to avoid memory thrashing
+    app.state.transcriber_lock = asyncio.Lock()
+    app.state.diarizer_lock = asyncio.Lock()
+    app.state.topic_detector_lock = asyncio.Lock()
+    app.state.summarizer_lock = asyncio.Lock()
+    
+    app.state.redis = None
+    if REDIS_URL:
+        try:
+            import redis.asyncio as aioredis
+            app.state.redis = aioredis.from_url(REDIS_URL, decode_responses=True)
+            await app.state.redis.ping()
+            logger.info("Job status is stored in Redis")
+        except Exception as e:
+            logger.error(f"Error connecting to Redis, keeping job status in memory: {str(e)}")
+            app.state.redis = None
+    
+    app.state.job_queue = asyncio.Queue()
+    app.state.job_worker = asyncio.create_task(job_worker(app.state.job_queue))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the background job worker."""
+    app.state.job_worker.cancel()
+    if app.state.redis is not None:
+        await app.state.redis.close()
+    if _gpu_worker is not None:
+        _gpu_worker.stop()
+    if USE_CPU_POOL and get_cpu_pool.cache_info().currsize and get_cpu_pool():
+        get_cpu_pool().shutdown(wait=False, cancel_futures=True)
+    EXECUTOR.shutdown(wait=False)
+
+async def _set_job_stage(job_id, stage, progress):
+    """Record the current processing stage of a job and notify subscribers"""
+    redis = app.state.redis
+    if redis is None:
+        # Finished jobs are served from their results file
+        if stage in JOB_FINAL_STAGES:
+            JOB_STATUS.pop(job_id, None)
+        else:
+            JOB_STATUS[job_id] = {"stage": stage, "progress": progress}
+        for queue in JOB_SUBSCRIBERS.get(job_id, ()):
+            queue.put_nowait({"job_id": job_id, "stage": stage, "progress": progress})
+        return
+    
+    try:
+        key = f"job:{job_id}"
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={"stage": stage, "progress": progress})
+            pipe.expire(key, JOB_STATUS_TTL)
+            pipe.publish(key, orjson.dumps({"job_id": job_id, "stage": stage, "progress": progress}))
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to update status for job {job_id}: {str(e)}")
+
+async def _get_job_stage(job_id):
+    """Return the stored status of a job, or None if it is unknown"""
+    redis = app.state.redis
+    if redis is None:
+        return JOB_STATUS.get(job_id)
+    
+    try:
+        status = await redis.hgetall(f"job:{job_id}")
+    except Exception as e:
+        logger.warning(f"Failed to read status for job {job_id}: {str(e)}")
+        return None
+    if not status:
+        return None
+    return {"stage": status.get("stage"), "progress": int(status.get("progress", 0))}
+
+async def _claim_job(job_id):
+    """
+    Atomically claim a job for processing. Returns False if an upload of the
+    same audio already holds the claim.
+    """
+    redis = app.state.redis
+    if redis is None:
+        if job_id in JOB_CLAIMS:
+            return False
+        JOB_CLAIMS.add(job_id)
+        return True
+    
+    try:
+        return bool(await redis.set(f"job:{job_id}:claim", 1, nx=True, ex=JOB_STATUS_TTL))
+    except Exception as e:
+        logger.warning(f"Failed to claim job {job_id}: {str(e)}")
+        return True
+
+async def _release_job(job_id):
+    """Release the claim on a failed job so its audio can be uploaded again"""
+    redis = app.state.redis
+    if redis is None:
+        JOB_CLAIMS.discard(job_id)
+        return
+    
+    try:
+        await redis.delete(f"job:{job_id}:claim")
+    except Exception as e:
+        logger.warning(f"Failed to release job {job_id}: {str(e)}")
+
+@contextlib.asynccontextmanager
+async def _subscribe_job(job_id):
+    """
+    Subscribe to a job's stage updates. Yields an async function that waits
+    up to a timeout for the next update and returns None if none arrived.
+    """
+    redis = app.state.redis
+    if redis is None:
+        queue = asyncio.Queue()
+        JOB_SUBSCRIBERS.setdefault(job_id, set()).add(queue)
+        
+        async def next_update(timeout):
+            try:
+                return await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return None
+        
+        try:
+            yield next_update
+        finally:
+            subscribers = JOB_SUBSCRIBERS.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del JOB_SUBSCRIBERS[job_id]
+        return
+    
+    key = f"job:{job_id}"
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(key)
+    
+    async def next_update(timeout):
+        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return orjson.loads(message["data"]) if message else None
+    
+    try:
+        yield next_update
+    finally:
+        await pubsub.unsubscribe(key)
+        await pubsub.close()
+
 # Helper function to make objects JSON serializable
 def make_serializable(obj):
     """Convert non-serializable objects to serializable types."""
     if isinstance(obj, Path):
         return str(obj)
+    # NumPy arrays and scalars
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
+def _results_path(key):
+    """Path of the results file for a job"""
+    return UPLOAD_DIR / f"{key}{RESULTS_SUFFIX}"
+
+async def _write_results(job_id, results):
+    """
+    Serialize a job's results to its results file. The data is written to a
+    temporary file that is then renamed, so readers never see a partial file.
+    """
+    results_file = _results_path(job_id)
+    temp_file = results_file.with_name(results_file.name + ".tmp")
+    async with aiofiles.open(temp_file, 'wb') as f:
+        await f.write(msgpack.packb(results, use_bin_type=True, default=make_serializable))
+    os.replace(temp_file, results_file)
+
+async def _read_results(results_file, raw=False):
+    """Read a results file, returning the packed bytes if raw is set"""
+    async with aiofiles.open(results_file, 'rb') as f:
+        data = await f.read()
+    return data if raw else msgpack.unpackb(data, raw=False)
+
+async def _has_successful_results(job_id):
+    """
+    Check whether a job has saved results that can be reused. A results file
+    left by a failed job (an error result or an "Error:" transcript) is
+    removed so the job can be run again. Only needed once a job's claim is
+    gone, e.g. after a restart or once the claim expired.
+    """
+    results_file = _results_path(job_id)
+    if not results_file.exists():
+        return False
+    try:
+        results = await _read_results(results_file)
+        transcript = results.get("transcript")
+        successful = (results.get("status") != "error"
+                      and isinstance(transcript, str) and not transcript.startswith("Error:"))
+    except Exception as e:
+        logger.warning(f"Could not read results for job {job_id}: {str(e)}")
+        successful = False
+    if not successful:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(results_file)
+    return successful
+
 # Health check endpoint
 @app.get("/api/healthcheck")
 def healthcheck():
@@ -209,51 +602,74 @@ def read_api_root():
 
 # File Upload Endpoint
 @app.post("/api/upload", response_model=ProcessResponse)
-async def process_upload(file: UploadFile = File(...), background_tasks: BackgroundTasks = None):
+async def process_upload(file: UploadFile = File(...)):
     """
     Upload and process an audio file
     """
     if not file:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
-    # Generate a unique job ID
-    import uuid
-    job_id = str(uuid.uuid4())
-    
-    # Get file extension and create a unique filename
+    # Get file extension and stream to a temporary name until the job ID is known
+    claimed = False
     file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{job_id}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
+    temp_path = UPLOAD_DIR / f"{uuid.uuid4()}{file_extension}.part"
     
     try:
-        # Save the uploaded file
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Stream the uploaded file to disk in chunks to bound memory use,
+        # hashing the content as it is written. The job ID is the content
+        # hash, keyed by the model size since results depend on both
+        hasher = hashlib.blake2b(digest_size=16, key=WHISPER_MODEL_SIZE.encode())
+        async with aiofiles.open(temp_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
+                hasher.update(chunk)
+        job_id = hasher.hexdigest()
+        
+        # Identical audio that is already processed or still in progress
+        # shares the existing job instead of being processed again. The claim
+        # is taken atomically, so concurrent identical uploads queue it once
+        claimed = await _claim_job(job_id)
+        if not claimed or await _has_successful_results(job_id):
+            os.remove(temp_path)
+            logger.info(f"Upload matches existing job {job_id}, skipping processing")
+            status = await _get_job_stage(job_id)
+            in_progress = (status["stage"] not in JOB_FINAL_STAGES if status
+                           else not _results_path(job_id).exists())
+            return ORJSONResponse({
+                "job_id": job_id,
+                "status": "processing" if in_progress else "completed",
+                "file_name": file.filename
+            })
         
+        file_path = UPLOAD_DIR / f"{job_id}{file_extension}"
+        os.replace(temp_path, file_path)
         logger.info(f"File saved as {file_path}")
         
-        # Process the file in the background
-        if background_tasks:
-            background_tasks.add_task(
-                process_audio_file, 
-                file_path=file_path,
-                job_id=job_id
-            )
+        # Queue the file for background processing
+        await _set_job_stage(job_id, "queued", 0)
+        await app.state.job_queue.put({
+            "file_path": file_path,
+            "job_id": job_id,
+            "metadata": None
+        })
         
-        return {
+        return ORJSONResponse({
             "job_id": job_id,
             "status": "processing",
             "file_name": file.filename
-        }
+        })
     
     except Exception as e:
+        if temp_path.exists():
+            os.remove(temp_path)
+        if claimed:
+            await _release_job(job_id)
         logger.error(f"Error processing upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 # YouTube URL Processing Endpoint
 @app.post("/api/youtube", response_model=ProcessResponse)
-async def process_youtube(url: str = Form(...), background_tasks: BackgroundTasks = None):
+async def process_youtube(url: str = Form(...)):
     """
     Process a YouTube URL
     """
@@ -261,15 +677,14 @@ async def process_youtube(url: str = Form(...), background_tasks: BackgroundTask
         raise HTTPException(status_code=400, detail="No YouTube URL provided")
     
     # Generate a unique job ID
-    import uuid
     job_id = str(uuid.uuid4())
     
     try:
         # Create YouTube downloader
-        youtube_dl = YouTubeDownloader(download_dir=UPLOAD_DIR)
+        youtube_dl = get_processor_class("YouTubeDownloader")(download_dir=UPLOAD_DIR)
         
-        # Download the YouTube video (audio only)
-        download_result = youtube_dl.download_audio(url)
+        # Download the YouTube video (audio only) without blocking the event loop
+        download_result = await youtube_dl.download_audio_async(url)
         
         if download_result.get('error'):
             raise HTTPException(status_code=400, detail=download_result['error'])
@@ -279,26 +694,25 @@ async def process_youtube(url: str = Form(...), background_tasks: BackgroundTask
         if not file_path or not os.path.exists(file_path):
             raise HTTPException(status_code=500, detail="Failed to download YouTube audio")
         
-        # Process the file in the background
-        if background_tasks:
-            background_tasks.add_task(
-                process_audio_file, 
-                file_path=file_path,
-                job_id=job_id,
-                metadata={
-                    "source": "youtube",
-                    "url": url,
-                    "video_title": download_result.get('title', ''),
-                    "video_author": download_result.get('uploader', ''),
-                    "duration": download_result.get('duration', 0)
-                }
-            )
+        # Queue the file for background processing
+        await _set_job_stage(job_id, "queued", 0)
+        await app.state.job_queue.put({
+            "file_path": file_path,
+            "job_id": job_id,
+            "metadata": {
+                "source": "youtube",
+                "url": url,
+                "video_title": download_result.get('title', ''),
+                "video_author": download_result.get('uploader', ''),
+                "duration": download_result.get('duration', 0)
+            }
+        })
         
-        return {
+        return ORJSONResponse({
             "job_id": job_id,
             "status": "processing",
             "file_name": os.path.basename(file_path)
-        }
+        })
     
     except Exception as e:
         logger.error(f"Error processing YouTube URL: {str(e)}")
@@ -306,15 +720,30 @@ async def process_youtube(url: str = Form(...), background_tasks: BackgroundTask
 
 # Get Results Endpoint
 @app.get("/api/results/{job_id}")
-async def get_results(job_id: str):
+async def get_results(job_id: str, request: Request):
     """
-    Get processing results for a specific job
+    Get processing results for a specific job. Clients sending
+    "Accept: application/msgpack" receive the stored msgpack bytes as-is.
     """
+    # Unfinished jobs are answered from the status store without touching disk
+    status = await _get_job_stage(job_id)
+    if status and status["stage"] not in JOB_FINAL_STAGES:
+        return ORJSONResponse(
+            status_code=202,
+            content={
+                "job_id": job_id,
+                "status": "processing",
+                "stage": status["stage"],
+                "progress": status["progress"],
+                "message": "Still processing. Please try again later."
+            }
+        )
+    
     # Check if the results file exists
-    results_file = UPLOAD_DIR / f"{job_id}_results.json"
+    results_file = _results_path(job_id)
     
     if not results_file.exists():
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=202,
             content={
                 "job_id": job_id,
@@ -324,281 +753,535 @@ async def get_results(job_id: str):
         )
     
     try:
-        with open(results_file, 'r') as f:
-            results = json.load(f)
+        if MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+            return Response(await _read_results(results_file, raw=True), media_type=MSGPACK_MEDIA_TYPE)
+        
+        # Serve the cached copy unless the file has changed since it was read
+        mtime = results_file.stat().st_mtime
+        async with RESULTS_CACHE_LOCK:
+            cached = RESULTS_CACHE.get(job_id)
+            if cached and cached[0] == mtime:
+                RESULTS_CACHE.move_to_end(job_id)
+                return ORJSONResponse(cached[1])
+        
+        results = await _read_results(results_file)
         
-        return results
+        async with RESULTS_CACHE_LOCK:
+            RESULTS_CACHE[job_id] = (mtime, results)
+            RESULTS_CACHE.move_to_end(job_id)
+            if len(RESULTS_CACHE) > RESULTS_CACHE_SIZE:
+                RESULTS_CACHE.popitem(last=False)
+        
+        return ORJSONResponse(results)
     
     except Exception as e:
         logger.error(f"Error retrieving results for job {job_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error retrieving results: {str(e)}")
 
-# Audio Processing Function (runs in background)
-async def process_audio_file(file_path, job_id, metadata=None):
-    """Process an audio file with all available processors"""
-    try:
-        logger.info(f"Starting processing for job {job_id} - file: {file_path}")
+# Job Events Endpoint
+@app.get("/api/results/{job_id}/stream")
+async def stream_results(job_id: str, request: Request):
+    """
+    Stream a job's stage changes as Server-Sent Events until it finishes
+    """
+    return StreamingResponse(
+        _job_events(job_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _job_events(job_id, request):
+    """Yield SSE messages for a job's current stage and each later change"""
+    # Subscribe before reading the current stage so no update is missed
+    async with _subscribe_job(job_id) as next_update:
+        status = await _get_job_stage(job_id)
+        if status is None and _results_path(job_id).exists():
+            status = {"stage": "done", "progress": 100}
+        if status:
+            yield b"data: " + orjson.dumps({"job_id": job_id, **status}) + b"\n\n"
         
-        # Initialize results dictionary
-        results = {
-            "job_id": job_id,
-            "status": "completed",
-            "error": None
-        }
+        while not (status and status["stage"] in JOB_FINAL_STAGES):
+            update = await next_update(JOB_STREAM_KEEPALIVE)
+            if update is None:
+                if await request.is_disconnected():
+                    return
+                yield b": keep-alive\n\n"
+                continue
+            status = update
+            yield b"data: " + orjson.dumps(status) + b"\n\n"
+
+# Background job worker: accumulates queued jobs into small batches so the
+# shared models are reused across files instead of being set up per job
+async def job_worker(queue: asyncio.Queue):
+    """Consume jobs from the queue and process them in batches."""
+    loop = asyncio.get_running_loop()
+    await app.state.warm_up
+    
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + JOB_BATCH_MAX_WAIT
         
-        # Create audio processor
-        try:
-            audio_processor = AudioProcessor()
-            logger.info(f"Audio processor initialized for job {job_id}")
-        except Exception as e:
-            logger.error(f"Error initializing audio processor for job {job_id}: {str(e)}")
-            results["warning"] = f"Error initializing audio processor: {str(e)}"
-            # Continue with other processors if possible
+        # Collect more jobs until the batch is full or the window closes
+        while len(batch) < JOB_BATCH_MAX_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
         
-        # Extract audio metadata
         try:
-            audio_metadata = audio_processor.extract_metadata(file_path)
-            
-            if metadata:
-                # Merge with provided metadata
-                audio_metadata.update(metadata)
-            
-            # Add file info
-            audio_metadata["file_path"] = str(file_path)
-            audio_metadata["audio_url"] = f"/api/audio/{os.path.basename(file_path)}"
-            
-            # Save metadata
-            results["metadata"] = audio_metadata
+            await process_audio_batch(batch)
         except Exception as e:
-            logger.error(f"Error extracting metadata for job {job_id}: {str(e)}")
-            results["metadata"] = {
-                "error": f"Failed to extract metadata: {str(e)}",
-                "file_path": str(file_path),
-                "audio_url": f"/api/audio/{os.path.basename(file_path)}"
-            }
-        
-        # Initialize transcriber with proper error handling
-        transcriber = None
+            logger.error(f"Error processing job batch: {str(e)}")
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+# Audio Processing Function (runs in background)
+async def process_audio_batch(jobs):
+    """Process a batch of jobs with one transcriber call for all of their files"""
+    # Extract metadata for all files with a single ffmpeg run
+    try:
+        audio_processor = await run_blocking(get_audio_processor)
+        batch_metadata = await run_blocking(
+            audio_processor.extract_metadata_batch, [job["file_path"] for job in jobs])
+    except Exception as e:
+        logger.warning(f"Batch metadata extraction failed: {str(e)}")
+        batch_metadata = [None] * len(jobs)
+    
+    prepared = []
+    for job, audio_metadata in zip(jobs, batch_metadata):
+        file_path = job["file_path"]
+        job_id = job["job_id"]
         try:
-            whisper_size = os.environ.get("WHISPER_MODEL_SIZE", "base")
-            transcriber = WhisperTranscriber(model_size=whisper_size)
-            
-            # Check if we're in mock mode (Whisper not available)
-            if transcriber._mock_mode:
-                logger.warning(f"Running in mock mode for job {job_id} - Whisper not available")
-                results["warning"] = "Running in mock mode - Whisper not available. Results may be limited."
+            logger.info(f"Starting processing for job {job_id} - file: {file_path}")
+            results = await run_blocking(
+                _prepare_job, file_path, job_id, job.get("metadata"), audio_metadata)
+            _remember_duration(file_path, results["metadata"].get("duration_seconds"))
+            prepared.append((job, results))
         except Exception as e:
+            await _save_job_error(job_id, e)
+    
+    if not prepared:
+        return
+    
+    # Use the shared transcriber
+    try:
+        transcriber = await run_blocking(get_transcriber)
+    except Exception as e:
+        for job, results in prepared:
+            job_id = job["job_id"]
             logger.error(f"Error creating transcriber for job {job_id}: {str(e)}")
             results["warning"] = f"Error initializing transcriber: {str(e)}"
             results["transcript"] = "Error: Transcription failed due to initialization error."
             results["segments"] = []
             
-            # Save results early since we can't proceed with transcription
-            results_file = UPLOAD_DIR / f"{job_id}_results.json"
-            with open(results_file, 'w') as f:
-                json.dump(results, f, default=make_serializable)
-            
             logger.error(f"Processing aborted for job {job_id} - transcriber initialization failed")
-            return
+        await asyncio.gather(*(
+            _finish_job(job["file_path"], job["job_id"], results) for job, results in prepared))
+        return
+    
+    # Check if we're in mock mode (Whisper not available)
+    if transcriber._mock_mode:
+        for job, results in prepared:
+            logger.warning(f"Running in mock mode for job {job['job_id']} - Whisper not available")
+            results["warning"] = "Running in mock mode - Whisper not available. Results may be limited."
+    
+    file_paths = [job["file_path"] for job, _ in prepared]
+    logger.info(f"Transcribing {len(file_paths)} files for jobs {', '.join(job['job_id'] for job, _ in prepared)}")
+    for job, _ in prepared:
+        await _set_job_stage(job["job_id"], "transcribing", 10)
+    
+    try:
+        async with app.state.transcriber_lock:
+            transcript_results = await run_blocking(transcriber.transcribe_batch, file_paths)
+    except Exception as e:
+        transcript_results = [e] * len(file_paths)
+    
+    # Finish the jobs concurrently, so one job's diarization and
+    # summarization do not hold up the rest of the batch
+    for (job, results), transcript_result in zip(prepared, transcript_results):
+        _apply_transcript(job["job_id"], results, transcript_result)
+    await asyncio.gather(*(
+        _finish_job(job["file_path"], job["job_id"], results) for job, results in prepared))
+
+def _prepare_job(file_path, job_id, metadata=None, audio_metadata=None):
+    """
+    Initialize the results for a job and extract its audio metadata. Blocks
+    on ffprobe when no batch metadata was extracted, so it is run through
+    run_blocking.
+    """
+    # Initialize results dictionary
+    results = {
+        "job_id": job_id,
+        "status": "completed",
+        "error": None
+    }
+    
+    # Create audio processor
+    try:
+        audio_processor = get_audio_processor()
+        logger.info(f"Audio processor initialized for job {job_id}")
+    except Exception as e:
+        logger.error(f"Error initializing audio processor for job {job_id}: {str(e)}")
+        results["warning"] = f"Error initializing audio processor: {str(e)}"
+        # Continue with other processors if possible
+    
+    # Extract audio metadata
+    try:
+        if audio_metadata is None:
+            audio_metadata = audio_processor.extract_metadata(file_path)
         
-        # Transcribe audio
-        try:
-            if transcriber:
-                logger.info(f"Transcribing audio for job {job_id}")
-                transcript_result = transcriber.transcribe(file_path)
-                
-                # Ensure transcript_result has expected format
-                if isinstance(transcript_result, dict):
-                    # Save transcript
-                    results["transcript"] = transcript_result.get("text", "")
-                    results["segments"] = transcript_result.get("segments", [])
-                else:
-                    # Handle case where transcribe returns a string (shouldn't happen now but be defensive)
-                    logger.warning(f"Unexpected transcript result type for job {job_id}: {type(transcript_result)}")
-                    if isinstance(transcript_result, str):
-                        results["transcript"] = transcript_result
-                    else:
-                        results["transcript"] = f"Error: Unexpected transcription result type: {type(transcript_result)}"
-                    results["segments"] = []
-            else:
-                logger.error(f"Transcriber not available for job {job_id}")
-                results["transcript"] = "Error: Transcription service unavailable."
-                results["segments"] = []
-        except Exception as e:
-            logger.error(f"Transcription error for job {job_id}: {str(e)}")
-            results["transcript"] = f"Error: {str(e)}"
-            results["segments"] = []
+        if metadata:
+            # Merge with provided metadata
+            audio_metadata.update(metadata)
         
-        # Check if we have valid transcript before proceeding with other steps
-        if not results.get("transcript") or results.get("transcript").startswith("Error:"):
-            logger.warning(f"No valid transcript for job {job_id}, skipping additional processing")
-            
-            # Save early results and return
-            results_file = UPLOAD_DIR / f"{job_id}_results.json"
-            with open(results_file, 'w') as f:
-                json.dump(results, f, default=make_serializable)
-            
-            logger.info(f"Processing completed with errors for job {job_id}")
-            return
+        # Add file info
+        audio_metadata["file_path"] = str(file_path)
+        audio_metadata["audio_url"] = f"/api/audio/{os.path.basename(file_path)}"
         
-        # Speaker diarization (with timeout)
-        if HF_ACCESS_TOKEN and results.get("segments") and isinstance(results.get("segments"), list):
-            try:
-                # Skip diarization for very short content (< 10 seconds or < 5 segments)
-                total_audio_duration = 0
-                for segment in results.get("segments", []):
-                    if isinstance(segment, dict) and "end" in segment:
-                        total_audio_duration = max(total_audio_duration, segment["end"])
-                
-                if total_audio_duration < 10 or len(results.get("segments", [])) < 5:
-                    logger.warning(f"Skipping diarization for job {job_id} - audio too short ({total_audio_duration:.1f}s, {len(results.get('segments', []))} segments)")
-                    results["diarization"] = {"error": "Audio too short for speaker detection"}
-                else:
-                    with time_limit(DIARIZATION_TIMEOUT):
-                        logger.info(f"Starting speaker diarization for job {job_id}")
-                        diarizer = SpeakerDiarization(use_auth_token=HF_ACCESS_TOKEN)
-                        transcript_data = {"segments": results["segments"]} if isinstance(results.get("segments"), list) else None
-                        diarization_result = diarizer.diarize(file_path, transcript_data)
-                        
-                        if isinstance(diarization_result, dict):
-                            results["diarization"] = diarization_result
-                            # Only update segments if the diarization provided valid segments
-                            if diarization_result.get("segments") and isinstance(diarization_result.get("segments"), list):
-                                results["segments"] = diarization_result.get("segments", results["segments"])
-                        else:
-                            logger.warning(f"Unexpected diarization result type for job {job_id}: {type(diarization_result)}")
-                            results["diarization"] = {"error": "Invalid diarization result format"}
-            except TimeoutError:
-                logger.warning(f"Speaker diarization timed out for job {job_id}")
-                results["diarization"] = {"error": "Speaker diarization timed out"}
-            except Exception as e:
-                logger.error(f"Speaker diarization error for job {job_id}: {str(e)}")
-                results["diarization"] = {"error": str(e)}
+        # Save metadata
+        results["metadata"] = audio_metadata
+    except Exception as e:
+        logger.error(f"Error extracting metadata for job {job_id}: {str(e)}")
+        results["metadata"] = {
+            "error": f"Failed to extract metadata: {str(e)}",
+            "file_path": str(file_path),
+            "audio_url": f"/api/audio/{os.path.basename(file_path)}"
+        }
+    
+    return results
+
+def _apply_transcript(job_id, results, transcript_result):
+    """Store a transcription result (or error) in the job results"""
+    if isinstance(transcript_result, Exception):
+        logger.error(f"Transcription error for job {job_id}: {str(transcript_result)}")
+        results["transcript"] = f"Error: {str(transcript_result)}"
+        results["segments"] = []
+    elif isinstance(transcript_result, dict):
+        # Save transcript
+        results["transcript"] = transcript_result.get("text", "")
+        results["segments"] = transcript_result.get("segments", [])
+    else:
+        # Handle case where transcribe returns a string (shouldn't happen now but be defensive)
+        logger.warning(f"Unexpected transcript result type for job {job_id}: {type(transcript_result)}")
+        if isinstance(transcript_result, str):
+            results["transcript"] = transcript_result
         else:
-            if not HF_ACCESS_TOKEN:
-                logger.warning(f"Skipping diarization for job {job_id} - HF_ACCESS_TOKEN not set")
-                results["diarization"] = {"error": "Hugging Face access token not provided"}
-            elif not results.get("segments") or not isinstance(results.get("segments"), list):
-                logger.warning(f"Skipping diarization for job {job_id} - No valid segments available")
-                results["diarization"] = {"error": "No valid segments available for diarization"}
-        
-        # Topic detection (with timeout)
-        if results.get("transcript") and not results.get("transcript").startswith("Error:"):
-            try:
-                with time_limit(TOPIC_DETECTION_TIMEOUT):
-                    logger.info(f"Detecting topics for job {job_id}")
-                    
-                    # Check if transcript is too short for meaningful topic detection
-                    if len(results["transcript"].split()) < 30:
-                        logger.warning(f"Transcript too short for topic detection for job {job_id}")
-                        results["topics"] = []
-                    else:
-                        topic_detector = TopicDetector()
-                        topics_result = topic_detector.detect_topics(results["transcript"])
-                        
-                        # Remember topics_result is already a list of dictionaries
-                        if isinstance(topics_result, list):
-                            results["topics"] = topics_result
-                        else:
-                            logger.warning(f"Unexpected topic detection result type for job {job_id}: {type(topics_result)}")
-                            results["topics"] = []
-            except TimeoutError:
-                logger.warning(f"Topic detection timed out for job {job_id}")
-                results["topics"] = []
-            except Exception as e:
-                logger.error(f"Topic detection error for job {job_id}: {str(e)}")
-                results["topics"] = []
+            results["transcript"] = f"Error: Unexpected transcription result type: {type(transcript_result)}"
+        results["segments"] = []
+
+async def _save_job_error(job_id, error):
+    """Save an error result for a job that failed outright"""
+    logger.error(f"Processing error for job {job_id}: {str(error)}")
+    # Save error to results file
+    try:
+        await _write_results(job_id, {
+            "job_id": job_id,
+            "status": "error",
+            "error": str(error)
+        })
+    except Exception as write_error:
+        logger.critical(f"Failed to write error results for job {job_id}: {str(write_error)}")
+    await _release_job(job_id)
+    await _set_job_stage(job_id, "error", 100)
+
+async def _finish_job(file_path, job_id, results):
+    """Run the post-transcription stages for a job and save its results once"""
+    try:
+        # Check if we have valid transcript before proceeding with other steps
+        has_transcript = bool(results.get("transcript")) and not results["transcript"].startswith("Error:")
+        if has_transcript:
+            # Diarization, topic detection and summarization only depend on the
+            # transcript, so run them concurrently
+            await _set_job_stage(job_id, "analyzing", 40)
+            stage_updates = await asyncio.gather(
+                _run_diarization(file_path, job_id, results.get("segments")),
+                _run_topic_detection(job_id, results["transcript"]),
+                _run_summarization(job_id, results["transcript"]),
+                return_exceptions=True
+            )
+            for update in stage_updates:
+                if isinstance(update, Exception):
+                    logger.error(f"Processing stage error for job {job_id}: {str(update)}")
+                else:
+                    results.update(update)
         else:
-            logger.warning(f"Skipping topic detection for job {job_id} - No valid transcript")
-            results["topics"] = []
+            logger.warning(f"No valid transcript for job {job_id}, skipping additional processing")
         
-        # Summarization (with timeout)
-        if results.get("transcript") and not results.get("transcript").startswith("Error:"):
-            try:
-                with time_limit(SUMMARIZATION_TIMEOUT):
-                    logger.info(f"Generating summaries for job {job_id}")
-                    
-                    # Check if transcript is too short for meaningful summarization
-                    if len(results["transcript"].split()) < 30:
-                        logger.warning(f"Transcript too short for summarization for job {job_id}")
-                        results["abstractive_summary"] = "The content is too short for a meaningful summary."
-                        results["extractive_summary"] = ["The content is too short for extracting key points."]
-                    else:
-                        # Extractive summary
-                        try:
-                            ext_summarizer = ExtractiveSummarizer()
-                            extractive_result = ext_summarizer.summarize(results["transcript"])
-                            
-                            # ExtractiveSummarizer now returns a dict with 'summary' key containing a list
-                            if isinstance(extractive_result, dict) and "summary" in extractive_result:
-                                results["extractive_summary"] = extractive_result["summary"]
-                            else:
-                                logger.warning(f"Unexpected extractive summary result for job {job_id}: {type(extractive_result)}")
-                                results["extractive_summary"] = ["Error generating extractive summary"]
-                        except Exception as e:
-                            logger.error(f"Extractive summarization error for job {job_id}: {str(e)}")
-                            results["extractive_summary"] = [f"Error: {str(e)}"]
-                        
-                        # Abstractive summary
-                        try:
-                            abs_summarizer = AbstractiveSummarizer()
-                            abstractive_result = abs_summarizer.summarize(results["transcript"])
-                            
-                            # AbstractiveSummarizer now returns a dict with 'summary' key containing a string
-                            if isinstance(abstractive_result, dict) and "summary" in abstractive_result:
-                                results["abstractive_summary"] = abstractive_result["summary"]
-                            else:
-                                logger.warning(f"Unexpected abstractive summary result for job {job_id}: {type(abstractive_result)}")
-                                results["abstractive_summary"] = "Error generating abstractive summary"
-                        except Exception as e:
-                            logger.error(f"Abstractive summarization error for job {job_id}: {str(e)}")
-                            results["abstractive_summary"] = f"Error: {str(e)}"
-            except TimeoutError:
-                logger.warning(f"Summarization timed out for job {job_id}")
-                results["abstractive_summary"] = "Summarization timed out"
-                results["extractive_summary"] = ["Summarization timed out"]
-            except Exception as e:
-                logger.error(f"Summarization error for job {job_id}: {str(e)}")
-                results["abstractive_summary"] = f"Error: {str(e)}"
-                results["extractive_summary"] = [f"Error: {str(e)}"]
+        # Save results to file
+        await _write_results(job_id, results)
+    except Exception as e:
+        await _save_job_error(job_id, e)
+        return
+    
+    if not has_transcript:
+        await _release_job(job_id)
+    await _set_job_stage(job_id, "done", 100)
+    if has_transcript:
+        logger.info(f"Processing completed for job {job_id}")
+    else:
+        logger.info(f"Processing completed with errors for job {job_id}")
+
+async def _run_diarization(file_path, job_id, segments):
+    """Speaker diarization (with timeout); returns the result keys to update"""
+    if not HF_ACCESS_TOKEN:
+        logger.warning(f"Skipping diarization for job {job_id} - HF_ACCESS_TOKEN not set")
+        return {"diarization": {"error": "Hugging Face access token not provided"}}
+    if not segments or not isinstance(segments, list):
+        logger.warning(f"Skipping diarization for job {job_id} - No valid segments available")
+        return {"diarization": {"error": "No valid segments available for diarization"}}
+    
+    try:
+        # Skip diarization for very short content (< 10 seconds or < 5 segments).
+        # Whisper segments are in time order, so the last one ends the audio
+        segment_count = len(segments)
+        last_segment = segments[-1]
+        if isinstance(last_segment, dict) and "end" in last_segment:
+            total_audio_duration = last_segment["end"]
         else:
-            logger.warning(f"Skipping summarization for job {job_id} - No valid transcript")
-            results["abstractive_summary"] = "Summarization skipped - No valid transcript"
-            results["extractive_summary"] = ["Summarization skipped - No valid transcript"]
+            total_audio_duration = max(
+                (s["end"] for s in segments if isinstance(s, dict) and "end" in s), default=0)
         
-        # Save results to file
-        results_file = UPLOAD_DIR / f"{job_id}_results.json"
-        with open(results_file, 'w') as f:
-            json.dump(results, f, default=make_serializable)
+        if total_audio_duration < 10 or segment_count < 5:
+            logger.warning(f"Skipping diarization for job {job_id} - audio too short ({total_audio_duration:.1f}s, {segment_count} segments)")
+            return {"diarization": {"error": "Audio too short for speaker detection"}}
         
-        logger.info(f"Processing completed for job {job_id}")
+        logger.info(f"Starting speaker diarization for job {job_id}")
+        diarizer = await run_blocking(get_diarizer)
+        transcript_data = {"segments": segments}
+        diarization_result = await run_blocking_locked(
+            app.state.diarizer_lock, DIARIZATION_TIMEOUT, diarizer.diarize, file_path, transcript_data)
+        
+        if isinstance(diarization_result, dict):
+            update = {"diarization": diarization_result}
+            # Only update segments if the diarization provided valid segments
+            if diarization_result.get("segments") and isinstance(diarization_result.get("segments"), list):
+                update["segments"] = diarization_result["segments"]
+            return update
         
+        logger.warning(f"Unexpected diarization result type for job {job_id}: {type(diarization_result)}")
+        return {"diarization": {"error": "Invalid diarization result format"}}
+    except asyncio.TimeoutError:
+        logger.warning(f"Speaker diarization timed out for job {job_id}")
+        return {"diarization": {"error": "Speaker diarization timed out"}}
     except Exception as e:
-        logger.error(f"Processing error for job {job_id}: {str(e)}")
-        # Save error to results file
-        results_file = UPLOAD_DIR / f"{job_id}_results.json"
+        logger.error(f"Speaker diarization error for job {job_id}: {str(e)}")
+        return {"diarization": {"error": str(e)}}
+
+async def _run_topic_detection(job_id, transcript):
+    """Topic detection (with timeout); returns the result keys to update"""
+    try:
+        logger.info(f"Detecting topics for job {job_id}")
+        
+        # Check if transcript is too short for meaningful topic detection
+        if len(transcript.split()) < 30:
+            logger.warning(f"Transcript too short for topic detection for job {job_id}")
+            return {"topics": []}
+        
+        topics_result = await run_cpu_task(
+            "detect_topics", transcript, app.state.topic_detector_lock, TOPIC_DETECTION_TIMEOUT)
+        
+        # Remember topics_result is already a list of dictionaries
+        if isinstance(topics_result, list):
+            return {"topics": topics_result}
+        
+        logger.warning(f"Unexpected topic detection result type for job {job_id}: {type(topics_result)}")
+        return {"topics": []}
+    except asyncio.TimeoutError:
+        logger.warning(f"Topic detection timed out for job {job_id}")
+        return {"topics": []}
+    except Exception as e:
+        logger.error(f"Topic detection error for job {job_id}: {str(e)}")
+        return {"topics": []}
+
+async def _run_summarization(job_id, transcript):
+    """Summarization (with timeout); returns the result keys to update"""
+    update = {}
+    try:
+        logger.info(f"Generating summaries for job {job_id}")
+        
+        # Both summaries share one time budget
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SUMMARIZATION_TIMEOUT
+        
+        # Check if transcript is too short for meaningful summarization
+        if len(transcript.split()) < 30:
+            logger.warning(f"Transcript too short for summarization for job {job_id}")
+            return {
+                "abstractive_summary": "The content is too short for a meaningful summary.",
+                "extractive_summary": ["The content is too short for extracting key points."]
+            }
+        
+        # Extractive summary
         try:
-            with open(results_file, 'w') as f:
-                json.dump({
-                    "job_id": job_id,
-                    "status": "error",
-                    "error": str(e)
-                }, f)
-        except Exception as write_error:
-            logger.critical(f"Failed to write error results for job {job_id}: {str(write_error)}")
+            extractive_result = await run_cpu_task(
+                "extractive_summarize", transcript, timeout=deadline - loop.time())
+            
+            # ExtractiveSummarizer now returns a dict with 'summary' key containing a list
+            if isinstance(extractive_result, dict) and "summary" in extractive_result:
+                update["extractive_summary"] = extractive_result["summary"]
+            else:
+                logger.warning(f"Unexpected extractive summary result for job {job_id}: {type(extractive_result)}")
+                update["extractive_summary"] = ["Error generating extractive summary"]
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            logger.error(f"Extractive summarization error for job {job_id}: {str(e)}")
+            update["extractive_summary"] = [f"Error: {str(e)}"]
+        
+        # Abstractive summary
+        try:
+            abs_summarizer = await run_blocking(get_abstractive_summarizer)
+            abstractive_result = await run_blocking_locked(
+                app.state.summarizer_lock, deadline - loop.time(), abs_summarizer.summarize, transcript)
+            
+            # AbstractiveSummarizer now returns a dict with 'summary' key containing a string
+            if isinstance(abstractive_result, dict) and "summary" in abstractive_result:
+                update["abstractive_summary"] = abstractive_result["summary"]
+            else:
+                logger.warning(f"Unexpected abstractive summary result for job {job_id}: {type(abstractive_result)}")
+                update["abstractive_summary"] = "Error generating abstractive summary"
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            logger.error(f"Abstractive summarization error for job {job_id}: {str(e)}")
+            update["abstractive_summary"] = f"Error: {str(e)}"
+        
+        return update
+    except asyncio.TimeoutError:
+        logger.warning(f"Summarization timed out for job {job_id}")
+        return {
+            "abstractive_summary": "Summarization timed out",
+            "extractive_summary": ["Summarization timed out"]
+        }
+    except Exception as e:
+        logger.error(f"Summarization error for job {job_id}: {str(e)}")
+        return {
+            "abstractive_summary": f"Error: {str(e)}",
+            "extractive_summary": [f"Error: {str(e)}"]
+        }
 
 # Serve audio files
 @app.get("/api/audio/{filename}")
-async def get_audio(filename: str):
+async def get_audio(filename: str, request: Request):
     """
-    Serve an audio file from the uploads directory
+    Serve an audio file from the uploads directory, honouring byte ranges
+    so players can seek without re-downloading the file
     """
     file_path = UPLOAD_DIR / filename
     
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(file_path)
+    stat_result = file_path.stat()
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    
+    byte_range = _parse_range(request.headers.get("range"), stat_result.st_size)
+    if byte_range is None:
+        # Full file: FileResponse can use sendfile when given the stat result
+        return FileResponse(
+            file_path,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers={"Accept-Ranges": "bytes"}
+        )
+    
+    start, end = byte_range
+    return StreamingResponse(
+        _iter_file_range(file_path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{stat_result.st_size}",
+            "Content-Length": str(end - start + 1)
+        }
+    )
+
+def _parse_range(range_header, file_size):
+    """Parse a single 'bytes=start-end' range header into inclusive offsets."""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    
+    start_str, _, end_str = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, file_size - int(end_str))
+            end = file_size - 1
+    except ValueError:
+        return None
+    
+    end = min(end, file_size - 1)
+    if start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"}
+        )
+    return start, end
+
+def _iter_file_range(file_path, start, end, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yield the bytes of a file between two inclusive offsets."""
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+# Audio durations in seconds keyed by absolute file path, reused across trim requests.
+# Only touched from the event loop, so no lock is needed
+DURATION_CACHE_SIZE = int(os.environ.get("DURATION_CACHE_SIZE", 1024))
+DURATION_CACHE: "OrderedDict[str, float]" = OrderedDict()
+
+def _remember_duration(file_path, duration):
+    """Store a file's duration in the bounded duration cache"""
+    if not duration or duration <= 0:
+        return
+    key = os.path.abspath(file_path)
+    DURATION_CACHE[key] = float(duration)
+    DURATION_CACHE.move_to_end(key)
+    if len(DURATION_CACHE) > DURATION_CACHE_SIZE:
+        DURATION_CACHE.popitem(last=False)
+
+async def _get_audio_duration(file_path):
+    """
+    Get an audio file's duration: from the cache (filled as jobs are
+    prepared), then the metadata saved with the job results, and finally by
+    probing the file with ffprobe.
+    """
+    key = os.path.abspath(file_path)
+    if key in DURATION_CACHE:
+        DURATION_CACHE.move_to_end(key)
+        return DURATION_CACHE[key]
+    
+    # Uploaded files are named after their job ID
+    duration = await _duration_from_results(Path(file_path).stem)
+    if duration is None:
+        duration = await run_blocking(get_audio_processor().get_duration, file_path)
+        if not duration:
+            raise ValueError(f"Could not determine the duration of {file_path}")
+    
+    _remember_duration(key, duration)
+    return duration
+
+async def _duration_from_results(job_id):
+    """Read the duration in seconds from a job's saved metadata, or None if unavailable."""
+    try:
+        duration = (await _read_results(_results_path(job_id)))["metadata"]["duration_seconds"]
+    except Exception:
+        return None
+    return float(duration) if isinstance(duration, (int, float)) and duration > 0 else None
 
 # Audio trimming endpoint
 @app.post("/api/trim")
@@ -620,11 +1303,11 @@ async def trim_audio(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Create audio processor
-        audio_processor = AudioProcessor()
+        # Use the shared audio processor (it holds no per-file state)
+        audio_processor = get_audio_processor()
         
         # Trim audio
-        trimmed_file = audio_processor.trim_audio(
+        trimmed_file = await audio_processor.trim_audio_async(
             file_path=file_path,
             start_time=start_time,
             end_time=end_time
@@ -663,8 +1346,8 @@ async def trim_by_summary(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Create audio processor
-        audio_processor = AudioProcessor()
+        # Use the shared audio processor (it holds no per-file state)
+        audio_processor = get_audio_processor()
         
         # Parse summary points - it's a string, so we need to convert it
         try:
@@ -680,9 +1363,7 @@ async def trim_by_summary(
         
         # Get audio duration
         try:
-            import ffmpeg
-            probe = ffmpeg.probe(file_path)
-            duration = float(probe['format']['duration'])
+            duration = await _get_audio_duration(file_path)
             
             # Create evenly spaced segments for each summary point
             segment_duration = duration / len(summary_points_list)
@@ -708,7 +1389,7 @@ async def trim_by_summary(
         merged_segments = audio_processor.merge_segments(segments, padding_seconds)
         
         # Trim audio to multiple segments
-        trimmed_file = audio_processor.trim_to_highlights(
+        trimmed_file = await audio_processor.trim_to_highlights_async(
             file_path=file_path,
             segments=merged_segments
         )
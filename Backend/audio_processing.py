@@ -1,19 +1,338 @@
 ﻿import os
 import logging
+import asyncio
 import tempfile
+import subprocess
+import hashlib
+import uuid
+from contextlib import contextmanager, suppress
 from pathlib import Path
-from typing import Dict, Union, Optional, Tuple
+from typing import Dict, Generator, Iterator, List, Union, Optional, Tuple
 import ffmpeg
 import json
-from datetime import datetime
 from pydub import AudioSegment
+import numpy as np
 import re
+from bisect import bisect_right
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+# Aho-Corasick matching of summary points is optional; without it each point
+# is searched for segment by segment
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Header readers used when ffprobe fails; either one avoids decoding the audio
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Formats whose segments can be joined by the concat demuxer without re-encoding
+STREAM_COPY_SUFFIXES = {".mp3", ".aac", ".wav"}
+
+# Highlights covering at least this fraction of a file are cut as one span
+HIGHLIGHT_COVERAGE_THRESHOLD = 0.95
+
+# Pool for running ffmpeg processes side by side. Each call is its own process,
+# so threads are enough to spread the work across cores
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", os.cpu_count() or 1))
+_EXECUTOR = ThreadPoolExecutor(max_workers=AUDIO_WORKERS)
+
+# Encode re-encoded highlight segments in parallel ffmpeg processes joined by
+# stream copy. On by default when there is more than one worker; the joins
+# fall on encoder frame boundaries, masked by each segment's fades, so set it
+# to false for output matching the single filter graph exactly
+HIGHLIGHT_PARALLEL_PARTS = os.environ.get(
+    "HIGHLIGHT_PARALLEL_PARTS", str(AUDIO_WORKERS > 1)).lower() == "true"
+
+def _ffmpeg_threads(concurrent: int = 1) -> int:
+    """
+    Threads one ffmpeg process may use when `concurrent` processes run at
+    once, so parallel runs don't oversubscribe the CPU while a run on its
+    own can use every core. AUDIO_FFMPEG_THREADS overrides this.
+    """
+    override = os.environ.get("AUDIO_FFMPEG_THREADS")
+    if override:
+        try:
+            return min(64, max(1, int(override)))
+        except ValueError:
+            logger.warning(f"Ignoring invalid AUDIO_FFMPEG_THREADS value: {override}")
+    return max(1, (os.cpu_count() or 1) // max(1, concurrent))
+
+def _deterministic_name(stem: str, args, suffix: str) -> str:
+    """File name derived from the arguments that produce the file"""
+    digest = hashlib.blake2b(json.dumps(args, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{stem}_{digest}{suffix}"
+
+@contextmanager
+def _partial_output(output_path: Path):
+    """
+    Yield a temporary path to write an output to, moved into place only if
+    writing succeeds, so a partial file is never mistaken for a finished one.
+    """
+    partial_path = output_path.with_name(f"{output_path.stem}.{uuid.uuid4().hex[:8]}.partial{output_path.suffix}")
+    try:
+        yield partial_path
+        os.replace(partial_path, output_path)
+    finally:
+        if partial_path.exists():
+            os.remove(partial_path)
+
+# Only errors are logged, so successful runs write nothing to the stderr pipe
+FFMPEG_QUIET_ARGS = ["-hide_banner", "-loglevel", "error"]
+
+def _quiet(args: List[str]) -> List[str]:
+    """Insert the quiet logging options after the ffmpeg executable"""
+    return [args[0], *FFMPEG_QUIET_ARGS, *args[1:]]
+
+def _run_ffmpeg(args: List[str]):
+    """Run an ffmpeg command, raising with its error output if it fails"""
+    result = subprocess.run(_quiet(args), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+
+async def _run_ffmpeg_async(args: List[str]):
+    """Run an ffmpeg command without blocking the event loop"""
+    process = await asyncio.create_subprocess_exec(
+        *_quiet(args), stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+
+def _run_command_batches(batches: Generator[List[List[str]], None, None]):
+    """Run batches of ffmpeg commands in order; commands in a batch run in parallel"""
+    try:
+        for batch in batches:
+            if len(batch) == 1:
+                _run_ffmpeg(batch[0])
+            else:
+                list(_EXECUTOR.map(_run_ffmpeg, batch))
+    finally:
+        # Let the generator clean up its temporary files even on failure
+        batches.close()
+
+async def _run_blocking(func, *args):
+    """Run a blocking call, such as an ffprobe lookup, in the pool without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, func, *args)
+
+async def _run_command_batches_async(batches: Generator[List[List[str]], None, None]):
+    """
+    Async version of _run_command_batches. The generator itself may probe
+    the input to build its commands, so it is advanced in the pool.
+    """
+    # At most AUDIO_WORKERS processes at once, as with the thread pool
+    semaphore = asyncio.Semaphore(AUDIO_WORKERS)
+    
+    async def run(args):
+        async with semaphore:
+            await _run_ffmpeg_async(args)
+    
+    try:
+        while (batch := await _run_blocking(next, batches, None)) is not None:
+            await asyncio.gather(*(run(args) for args in batch))
+    finally:
+        # If cancelled while a pool thread is still advancing the generator,
+        # it can't be closed from here
+        with suppress(ValueError):
+            batches.close()
+
+# ffprobe fields read by extract_metadata, and by duration lookups
+METADATA_ENTRIES = (
+    "format=duration,size,format_name"
+    ":format_tags=title,artist,album,track,genre,date"
+    ":stream=codec_type,sample_rate,channels,bit_rate"
+)
+DURATION_ENTRIES = "format=duration,size,bit_rate:stream=duration"
+
+# Silence inserted between the segments of a key-point trim
+KEY_POINT_GAP_SECONDS = 0.5
+
+# Fade applied at both ends of re-encoded segments so joins don't click
+SEGMENT_FADE_SECONDS = 0.05
+
+def _fade_segment(stream, length: float):
+    """Fade a segment's audio in and out, unless it is too short to fade"""
+    if length <= 2 * SEGMENT_FADE_SECONDS:
+        return stream
+    return (
+        stream
+        .filter('afade', t='in', st=0, d=SEGMENT_FADE_SECONDS)
+        .filter('afade', t='out', st=length - SEGMENT_FADE_SECONDS, d=SEGMENT_FADE_SECONDS)
+    )
+
+# Word tokens used for text similarity
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+def _token_hashes(text: str) -> np.ndarray:
+    """
+    Sorted unique hashes of the words in an already lowercased text, for
+    vectorized set operations
+    """
+    return np.unique(np.fromiter((hash(w) for w in WORD_PATTERN.findall(text)), dtype=np.int64))
+
+def _jaccard(tokens1: np.ndarray, tokens2: np.ndarray) -> float:
+    """Jaccard similarity of two unique token hash arrays"""
+    if not tokens1.size or not tokens2.size:
+        return 0
+    intersection = np.intersect1d(tokens1, tokens2, assume_unique=True).size
+    return intersection / (tokens1.size + tokens2.size - intersection)
+
+def _find_exact_matches(point_texts, segment_texts) -> Dict[int, int]:
+    """
+    Map the index of each point to the index of the first segment whose
+    text contains it. With pyahocorasick all points are found in a single
+    pass over the joined segment texts.
+    """
+    if ahocorasick is None:
+        matches = {}
+        for i, point_text in enumerate(point_texts):
+            for j, segment_text in enumerate(segment_texts):
+                if point_text and point_text in segment_text:
+                    matches[i] = j
+                    break
+        return matches
+    
+    # Identical points share an automaton entry
+    point_indices = {}
+    for i, point_text in enumerate(point_texts):
+        if point_text:
+            point_indices.setdefault(point_text, []).append(i)
+    if not point_indices:
+        return {}
+    
+    automaton = ahocorasick.Automaton()
+    for point_text, indices in point_indices.items():
+        automaton.add_word(point_text, indices)
+    automaton.make_automaton()
+    
+    # A separator that never occurs in points keeps matches within one segment
+    offsets = []
+    position = 0
+    for segment_text in segment_texts:
+        offsets.append(position)
+        position += len(segment_text) + 1
+    joined = "\0".join(segment_texts)
+    
+    # Hits arrive in order of position, so the first one for a point is in
+    # the earliest segment containing it
+    matches = {}
+    for end_position, indices in automaton.iter(joined):
+        segment_index = bisect_right(offsets, end_position) - 1
+        for i in indices:
+            matches.setdefault(i, segment_index)
+    return matches
+
+# Trims seek this many seconds before the start on the input side (fast,
+# keyframe-aligned) and then cut precisely on the output side
+TRIM_PREROLL_SECONDS = 2.0
+
+# Trims shorter than this, or of these codecs, are re-encoded for
+# sample-accurate cuts instead of stream copied
+EXACT_TRIM_MIN_SECONDS = 1.0
+EXACT_TRIM_CODECS = {"flac"}
+EXACT_TRIM_CODEC_PREFIX = "pcm_"
+
+# Formats whose streams are found quickly, so ffprobe can read less of the file
+FAST_PROBE_SUFFIXES = {".mp3", ".wav", ".m4a"}
+
+def _probe_light(path: str, entries: str) -> Dict:
+    """Run ffprobe for only the requested entries, looking at the first audio stream"""
+    cmd = ["ffprobe", "-v", "error"]
+    if os.path.splitext(path)[1].lower() in FAST_PROBE_SUFFIXES:
+        cmd += ["-analyzeduration", "1000000", "-probesize", "1000000"]
+    cmd += ["-select_streams", "a:0", "-show_entries", entries, "-of", "json", path]
+    
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise ffmpeg.Error("ffprobe", result.stdout, result.stderr)
+    return json.loads(result.stdout)
+
+# Parsing of the input summaries ffmpeg prints to stderr, used to read the
+# metadata of many files in one run (ffprobe only accepts a single input)
+FFMPEG_INPUT_PATTERN = re.compile(r"^Input #(\d+), (.+?), from '(.*)':\s*$", re.M)
+FFMPEG_TAG_PATTERN = re.compile(r"^ {4}(\w+)\s*: (.*?)\s*$", re.M)
+FFMPEG_DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+FFMPEG_AUDIO_STREAM_PATTERN = re.compile(r"^\s*Stream #\d+:\d+.*?: Audio: (.*?)\s*$", re.M)
+FFMPEG_SAMPLE_RATE_PATTERN = re.compile(r"(\d+) Hz")
+FFMPEG_BITRATE_PATTERN = re.compile(r"(\d+) kb/s")
+FFMPEG_CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "5.0": 5, "5.1": 6, "7.1": 8}
+
+# Number of files given to one ffmpeg run when extracting metadata in batches
+METADATA_BATCH_SIZE = 64
+
+@lru_cache(maxsize=256)
+def _probe_cached(path: str, entries: str, size: int, mtime: float) -> Dict:
+    """Probe a file; size and mtime are part of the key so changed files are re-probed"""
+    return _probe_light(path, entries)
+
+def _read_audio_header(path: str) -> Optional[Tuple[float, int, int]]:
+    """
+    Read duration, channels and sample rate from a file's header with
+    soundfile (WAV, FLAC, OGG) or mutagen (MP3, M4A and most other formats).
+    
+    Returns:
+        (duration_seconds, channels, sample_rate), or None if neither can read it
+    """
+    if soundfile is not None:
+        try:
+            info = soundfile.info(path)
+            return info.duration, info.channels, info.samplerate
+        except Exception:
+            pass
+    
+    if mutagen is not None:
+        try:
+            media = mutagen.File(path)
+            if media is not None and media.info is not None:
+                return media.info.length, media.info.channels, media.info.sample_rate
+        except Exception:
+            pass
+    
+    return None
+
+@lru_cache(maxsize=256)
+def _duration_cached(path: str, size: int, mtime: float) -> float:
+    """
+    Resolve a file's duration from the container, then the audio stream,
+    then size / bit rate, then the file header, and finally by decoding it.
+    The result is cached
+    even when nothing worked (0.0), so such files aren't probed again.
+    """
+    try:
+        probe = _probe_cached(path, DURATION_ENTRIES, size, mtime)
+        fmt = probe.get('format', {})
+        streams = probe.get('streams', [])
+        for value in (fmt.get('duration'), streams[0].get('duration') if streams else None):
+            if value not in (None, 'N/A'):
+                return float(value)
+        if fmt.get('size') and fmt.get('bit_rate') not in (None, 'N/A', '0'):
+            return int(fmt['size']) * 8 / int(fmt['bit_rate'])
+    except Exception as e:
+        logger.warning(f"Error probing duration for {path}: {str(e)}")
+    
+    header = _read_audio_header(path)
+    if header and header[0] > 0:
+        return header[0]
+    
+    try:
+        return AudioSegment.from_file(path).duration_seconds
+    except Exception as e:
+        logger.warning(f"Error decoding {path} for its duration: {str(e)}")
+        return 0.0
+
 class AudioProcessor:
     """
     Audio processing utilities for metadata extraction and trimming.
@@ -25,6 +344,21 @@ class AudioProcessor:
         """
         pass
     
+    def probe(self, file_path: Union[str, Path], entries: str = METADATA_ENTRIES) -> Dict:
+        """
+        Get ffprobe output for a file, cached per (path, size, mtime).
+        The returned dictionary is shared between callers and must not be modified.
+        
+        Args:
+            file_path: Path to the file
+            entries: ffprobe -show_entries selection of the fields to read
+            
+        Returns:
+            Dictionary of ffprobe output
+        """
+        stat = os.stat(file_path)
+        return _probe_cached(str(file_path), entries, stat.st_size, stat.st_mtime)
+    
     def extract_metadata(self, file_path: Union[str, Path]) -> Dict:
         """
         Extract metadata from audio file.
@@ -46,7 +380,7 @@ class AudioProcessor:
             
             try:
                 # Try to get metadata using ffprobe
-                probe = ffmpeg.probe(file_path)
+                probe = self.probe(file_path)
                 
                 # Extract basic metadata
                 if 'format' in probe:
@@ -66,6 +400,7 @@ class AudioProcessor:
                     if 'duration' in fmt:
                         duration_secs = float(fmt['duration'])
                         result['duration'] = self._format_duration(duration_secs)
+                        result['duration_seconds'] = duration_secs
                     
                     # Add file size
                     if 'size' in fmt:
@@ -73,7 +408,7 @@ class AudioProcessor:
                         result['filesize'] = self._format_file_size(size_bytes)
                 
                 # Extract audio stream info
-                audio_streams = [s for s in probe['streams'] if s['codec_type'] == 'audio']
+                audio_streams = [s for s in probe.get('streams', []) if s.get('codec_type') == 'audio']
                 if audio_streams:
                     audio = audio_streams[0]
                     
@@ -94,12 +429,18 @@ class AudioProcessor:
                 logging.warning(f"Error extracting metadata with ffprobe: {str(e)}")
                 # Fall back to basic metadata extraction
                 
-                # Use pydub to get basic info
+                # Read basic info from the file header, decoding only as a last resort
                 try:
-                    audio = AudioSegment.from_file(file_path)
-                    result['duration'] = self._format_duration(audio.duration_seconds)
-                    result['channels'] = audio.channels
-                    result['sample_rate'] = f"{audio.frame_rate} Hz"
+                    header = _read_audio_header(str(file_path))
+                    if header:
+                        duration_secs, channels, sample_rate = header
+                    else:
+                        audio = AudioSegment.from_file(file_path)
+                        duration_secs, channels, sample_rate = audio.duration_seconds, audio.channels, audio.frame_rate
+                    result['duration'] = self._format_duration(duration_secs)
+                    result['duration_seconds'] = duration_secs
+                    result['channels'] = channels
+                    result['sample_rate'] = f"{sample_rate} Hz"
                     
                     # Get file size
                     size_bytes = os.path.getsize(file_path)
@@ -117,10 +458,110 @@ class AudioProcessor:
             logging.error(f"Error in extract_metadata: {str(e)}")
             return {"error": str(e)}
     
+    def extract_metadata_batch(self, file_paths: List[Union[str, Path]]) -> List[Dict]:
+        """
+        Extract metadata from several audio files, reading them with one
+        ffmpeg run per METADATA_BATCH_SIZE files instead of one ffprobe per
+        file. Files that ffmpeg couldn't describe fall back to extract_metadata.
+        
+        Args:
+            file_paths: Paths to the files
+            
+        Returns:
+            List with one metadata dictionary per path, as from extract_metadata
+        """
+        results = []
+        for i in range(0, len(file_paths), METADATA_BATCH_SIZE):
+            chunk = file_paths[i:i + METADATA_BATCH_SIZE]
+            parsed = {}
+            existing = [p for p in chunk if os.path.exists(p)]
+            if existing:
+                try:
+                    parsed = self._read_input_summaries(existing)
+                except Exception as e:
+                    logger.warning(f"Batch metadata extraction failed: {str(e)}")
+            
+            for file_path in chunk:
+                if str(file_path) in parsed:
+                    results.append(parsed[str(file_path)])
+                else:
+                    results.append(self.extract_metadata(file_path))
+        return results
+    
+    def _read_input_summaries(self, file_paths: List[Union[str, Path]]) -> Dict[str, Dict]:
+        """
+        Run ffmpeg with the files as inputs and parse the summary it prints
+        for each. ffmpeg stops at the first unreadable file, so later files
+        may be missing from the result.
+        
+        Args:
+            file_paths: Paths to existing files
+            
+        Returns:
+            Dictionary mapping each described path to its metadata
+        """
+        cmd = ["ffmpeg", "-hide_banner", "-nostdin"]
+        for file_path in file_paths:
+            cmd += ["-i", str(file_path)]
+        # With no output given ffmpeg exits with an error after describing
+        # the inputs, so the exit code is not checked
+        stderr = subprocess.run(cmd, capture_output=True).stderr.decode(errors="replace")
+        
+        matches = list(FFMPEG_INPUT_PATTERN.finditer(stderr))
+        parsed = {}
+        for n, match in enumerate(matches):
+            index = int(match.group(1))
+            if index >= len(file_paths):
+                continue
+            block_end = matches[n + 1].start() if n + 1 < len(matches) else len(stderr)
+            block = stderr[match.end():block_end]
+            file_path = file_paths[index]
+            
+            result = {"filepath": file_path}
+            
+            # Container tags are listed before the duration line
+            duration_match = FFMPEG_DURATION_PATTERN.search(block)
+            header = block[:duration_match.start()] if duration_match else block
+            for tag, value in FFMPEG_TAG_PATTERN.findall(header):
+                tag = tag.lower()
+                if tag in ('title', 'artist', 'album', 'track', 'genre', 'date'):
+                    result[tag] = value
+            
+            result['format'] = match.group(2)
+            if duration_match:
+                hours, minutes, seconds = duration_match.groups()
+                duration_secs = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+                result['duration'] = self._format_duration(duration_secs)
+                result['duration_seconds'] = duration_secs
+            result['filesize'] = self._format_file_size(os.path.getsize(file_path))
+            
+            stream_match = FFMPEG_AUDIO_STREAM_PATTERN.search(block)
+            if stream_match:
+                stream = stream_match.group(1)
+                bitrate_match = FFMPEG_BITRATE_PATTERN.search(stream)
+                if bitrate_match:
+                    result['bitrate'] = f"{bitrate_match.group(1)} kbps"
+                sample_rate_match = FFMPEG_SAMPLE_RATE_PATTERN.search(stream)
+                if sample_rate_match:
+                    result['sample_rate'] = f"{sample_rate_match.group(1)} Hz"
+                for part in stream.split(", "):
+                    layout = part.split("(")[0].strip()
+                    if layout in FFMPEG_CHANNEL_LAYOUTS:
+                        result['channels'] = FFMPEG_CHANNEL_LAYOUTS[layout]
+                        break
+            
+            parsed[str(file_path)] = result
+        return parsed
+    
     def trim(self, file_path: Union[str, Path], start_time: float, end_time: float) -> Path:
         """
         Trim audio file based on start and end times.
         
+        Uses two-stage seeking: a coarse input-side seek to a point shortly
+        before the start, then a precise output-side cut. The stream is copied
+        (fast, packet accurate) except for very short trims and PCM/FLAC
+        audio, which are re-encoded for sample-accurate bounds.
+        
         Args:
             file_path: Path to the file
             start_time: Start time in seconds
@@ -129,26 +570,46 @@ class AudioProcessor:
         Returns:
             Path to the trimmed file
         """
-        file_path = Path(file_path)
-        
         try:
-            logger.info(f"Trimming audio {file_path} from {start_time}s to {end_time}s")
+            file_path = Path(file_path)
+            output_path = self._output_path(file_path, "trimmed", [start_time, end_time])
+            if output_path.exists():
+                logger.info(f"Reusing trimmed audio file: {output_path}")
+                return output_path
             
-            # Create output file path
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_dir = file_path.parent
-            output_filename = f"{file_path.stem}_trimmed_{timestamp}{file_path.suffix}"
-            output_path = output_dir / output_filename
+            with _partial_output(output_path) as partial_path:
+                _run_ffmpeg(self._trim_command(file_path, start_time, end_time, partial_path))
+            logger.info(f"Audio file trimmed successfully: {output_path}")
+            return output_path
             
-            # Run ffmpeg to trim the file
-            (
-                ffmpeg
-                .input(str(file_path), ss=start_time, to=end_time)
-                .output(str(output_path), c="copy")
-                .overwrite_output()
-                .run(quiet=False, capture_stdout=True, capture_stderr=True)
-            )
+        except Exception as e:
+            logger.error(f"Error trimming audio file: {str(e)}")
+            raise
+    
+    async def trim_async(self, file_path: Union[str, Path], start_time: float, end_time: float) -> Path:
+        """
+        Async version of trim that doesn't block the event loop while ffprobe
+        or ffmpeg runs.
+        
+        Args:
+            file_path: Path to the file
+            start_time: Start time in seconds
+            end_time: End time in seconds
+            
+        Returns:
+            Path to the trimmed file
+        """
+        try:
+            file_path = Path(file_path)
+            output_path = self._output_path(file_path, "trimmed", [start_time, end_time])
+            if output_path.exists():
+                logger.info(f"Reusing trimmed audio file: {output_path}")
+                return output_path
             
+            with _partial_output(output_path) as partial_path:
+                # Building the command may probe the codec, so it runs in the pool
+                command = await _run_blocking(self._trim_command, file_path, start_time, end_time, partial_path)
+                await _run_ffmpeg_async(command)
             logger.info(f"Audio file trimmed successfully: {output_path}")
             return output_path
             
@@ -156,6 +617,103 @@ class AudioProcessor:
             logger.error(f"Error trimming audio file: {str(e)}")
             raise
     
+    def _output_path(self, file_path: Path, kind: str, params) -> Path:
+        """
+        Get the path for a file derived from file_path. The name is a hash of
+        the source file and the parameters, so repeating a request reuses
+        the earlier output.
+        
+        Args:
+            file_path: Path to the source file
+            kind: Kind of output, included in the name
+            params: JSON-serializable parameters that determine the output
+            
+        Returns:
+            Path to the output file
+        """
+        stat = os.stat(file_path)
+        args = {
+            "source": str(file_path.resolve()),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "kind": kind,
+            "params": params
+        }
+        return file_path.parent / _deterministic_name(f"{file_path.stem}_{kind}", args, file_path.suffix)
+    
+    def _trim_command(self, file_path: Path, start_time: float, end_time: float, output_path: Path) -> List[str]:
+        """
+        Build the ffmpeg command for a trim.
+        
+        Args:
+            file_path: Path to the file
+            start_time: Start time in seconds
+            end_time: End time in seconds
+            output_path: Path to write the trimmed audio to
+            
+        Returns:
+            ffmpeg arguments
+        """
+        logger.info(f"Trimming audio {file_path} from {start_time}s to {end_time}s")
+        
+        # Timestamps restart at the coarse seek point, so the output-side
+        # bounds are relative to it
+        coarse_start = max(0.0, start_time - TRIM_PREROLL_SECONDS)
+        output_args = {
+            "ss": start_time - coarse_start,
+            "to": end_time - coarse_start,
+            "threads": _ffmpeg_threads()
+        }
+        if not self._needs_exact_trim(file_path, end_time - start_time):
+            output_args["c"] = "copy"
+        
+        command = (
+            ffmpeg
+            .input(str(file_path), ss=coarse_start)
+            .output(str(output_path), **output_args)
+            .overwrite_output()
+            .compile()
+        )
+        return command
+    
+    def _needs_exact_trim(self, file_path: Union[str, Path], length: float) -> bool:
+        """
+        Check whether a trim should be re-encoded rather than stream copied.
+        
+        Args:
+            file_path: Path to the file
+            length: Length of the trim in seconds
+            
+        Returns:
+            True for short trims and PCM/FLAC audio
+        """
+        if length < EXACT_TRIM_MIN_SECONDS:
+            return True
+        try:
+            streams = self.probe(file_path, "stream=codec_name").get('streams', [])
+            codec = streams[0].get('codec_name', '') if streams else ''
+        except Exception as e:
+            logger.warning(f"Error getting codec for {file_path}: {str(e)}")
+            return False
+        return codec in EXACT_TRIM_CODECS or codec.startswith(EXACT_TRIM_CODEC_PREFIX)
+    
+    def get_duration(self, file_path: Union[str, Path]) -> float:
+        """
+        Get the duration of an audio file.
+
+        Args:
+            file_path: Path to the file
+
+        Returns:
+            Duration in seconds, or 0.0 if it cannot be determined
+        """
+        try:
+            stat = os.stat(file_path)
+            return _duration_cached(str(file_path), stat.st_size, stat.st_mtime)
+        except Exception as e:
+            logger.warning(f"Error getting duration for {file_path}: {str(e)}")
+            return 0.0
+
     def _format_duration(self, seconds: float) -> str:
         """
         Format duration in seconds to MM:SS format.
@@ -202,49 +760,45 @@ class AudioProcessor:
             base_name = os.path.splitext(os.path.basename(input_file))[0]
             output_file = os.path.join(os.path.dirname(input_file), f"{base_name}_trimmed.mp3")
         
-        # Load the audio file
-        try:
-            audio = AudioSegment.from_file(input_file)
-        except Exception as e:
-            logging.error(f"Failed to load audio file: {str(e)}")
-            raise RuntimeError(f"Failed to load audio file: {str(e)}")
+        # Get the audio duration to bound the segments; the audio itself is
+        # only decoded by ffmpeg when the output is written
+        if not os.path.exists(input_file):
+            logging.error(f"Failed to load audio file: {input_file} not found")
+            raise RuntimeError(f"Failed to load audio file: {input_file} not found")
+        duration = self.get_duration(input_file)
         
-        # Find segments that contain key points
-        key_segments = []
-        for point in summary_points:
-            point_text = point.lower().strip()
-            # Find the segment that contains this key point
-            for segment in segments:
-                segment_text = segment.get('text', '').lower().strip()
-                # Check if the key point is contained in this segment
-                # Use fuzzy matching to handle slight differences in text
-                if (point_text in segment_text or 
-                    self._calculate_text_similarity(point_text, segment_text) > 0.75):
-                    start_time = max(0, segment.get('start', 0) - padding_seconds) * 1000  # convert to ms
-                    end_time = min(len(audio), segment.get('end', 0) + padding_seconds) * 1000  # convert to ms
-                    key_segments.append({
-                        'start': start_time,
-                        'end': end_time,
-                        'text': segment.get('text', '')
-                    })
-                    break
+        # Normalize each segment and point once rather than per comparison
+        segment_texts = [segment.get('text', '').lower().strip() for segment in segments]
+        point_texts = [point.lower().strip() for point in summary_points]
         
-        # Sort segments by start time
-        key_segments.sort(key=lambda x: x['start'])
+        # Find segments that contain key points, using exact matches first
+        exact_matches = _find_exact_matches(point_texts, segment_texts)
+        segment_tokens = None
+        key_segments = []
+        for i, point_text in enumerate(point_texts):
+            segment_index = exact_matches.get(i)
+            if segment_index is None:
+                # Use fuzzy matching to handle slight differences in text;
+                # segments are only tokenized if some point needs it
+                if segment_tokens is None:
+                    segment_tokens = [_token_hashes(text) for text in segment_texts]
+                point_tokens = _token_hashes(point_text)
+                segment_index = next(
+                    (j for j, tokens in enumerate(segment_tokens) if _jaccard(point_tokens, tokens) > 0.75),
+                    None
+                )
+            if segment_index is None:
+                continue
+            
+            segment = segments[segment_index]
+            key_segments.append({
+                'start': segment.get('start', 0),
+                'end': segment.get('end', 0),
+                'text': segment.get('text', '')
+            })
         
-        # Merge overlapping segments
-        merged_segments = []
-        if key_segments:
-            current_segment = key_segments[0]
-            for segment in key_segments[1:]:
-                if segment['start'] <= current_segment['end']:
-                    # Segments overlap, merge them
-                    current_segment['end'] = max(current_segment['end'], segment['end'])
-                else:
-                    # No overlap, add current segment to result and move to next
-                    merged_segments.append(current_segment)
-                    current_segment = segment
-            merged_segments.append(current_segment)
+        # Pad, sort and merge overlapping segments
+        merged_segments = self.merge_segments(key_segments, padding_seconds)
         
         # Check if we found any segments to include
         if not merged_segments:
@@ -253,23 +807,19 @@ class AudioProcessor:
         
         # Create the output audio file from the merged segments
         logging.info(f"Creating trimmed audio with {len(merged_segments)} key segments")
-        output_audio = AudioSegment.empty()
+        bounds = [
+            (segment['start'], min(duration, segment['end']) if duration else segment['end'])
+            for segment in merged_segments
+        ]
         
-        for i, segment in enumerate(merged_segments):
-            start_ms = int(segment['start'])
-            end_ms = int(segment['end'])
-            
-            # Add segment to output
-            segment_audio = audio[start_ms:end_ms]
-            output_audio += segment_audio
-            
-            # Add a short silence between segments, except after the last one
-            if i < len(merged_segments) - 1:
-                output_audio += AudioSegment.silent(duration=500)  # 500ms of silence
-                
-        # Export the output audio
+        # Cut, join and encode the segments in a single ffmpeg run
         logging.info(f"Exporting trimmed audio to {output_file}")
-        output_audio.export(output_file, format="mp3")
+        _run_ffmpeg(
+            self._concat_graph(input_file, bounds, gap_seconds=KEY_POINT_GAP_SECONDS)
+            .output(str(output_file), format="mp3", threads=_ffmpeg_threads())
+            .overwrite_output()
+            .compile()
+        )
         
         return output_file
 
@@ -278,25 +828,17 @@ class AudioProcessor:
         Calculate similarity between two text strings.
         
         Args:
-            text1: First text string
-            text2: Second text string
+            text1: First text string, or its precomputed token hashes
+            text2: Second text string, or its precomputed token hashes
             
         Returns:
             Similarity score between 0 and 1
         """
         # Simple similarity based on word overlap
         # This could be replaced with more sophisticated methods
-        words1 = set(re.findall(r'\b\w+\b', text1.lower()))
-        words2 = set(re.findall(r'\b\w+\b', text2.lower()))
-        
-        if not words1 or not words2:
-            return 0
-            
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        jaccard_similarity = len(intersection) / len(union)
-        return jaccard_similarity 
+        tokens1 = text1 if isinstance(text1, np.ndarray) else _token_hashes(text1.lower())
+        tokens2 = text2 if isinstance(text2, np.ndarray) else _token_hashes(text2.lower())
+        return _jaccard(tokens1, tokens2)
 
     def trim_audio(self, file_path: Union[str, Path], start_time: float, end_time: float) -> str:
         """
@@ -312,26 +854,7 @@ class AudioProcessor:
             Path to the trimmed file as string
         """
         try:
-            # Ensure file exists
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File not found: {file_path}")
-                
-            # Validate time values
-            if start_time < 0:
-                start_time = 0
-                
-            # Get file duration
-            try:
-                probe = ffmpeg.probe(file_path)
-                duration = float(probe['format']['duration'])
-                
-                if end_time > duration:
-                    end_time = duration
-                    
-                if start_time >= end_time:
-                    raise ValueError("Start time must be less than end time")
-            except Exception as e:
-                logger.warning(f"Error checking duration: {str(e)}")
+            start_time, end_time = self._validate_trim_bounds(file_path, start_time, end_time)
             
             # Call the internal trim method
             output_path = self.trim(file_path, start_time, end_time)
@@ -341,6 +864,58 @@ class AudioProcessor:
             logger.error(f"Error in trim_audio: {str(e)}")
             raise
     
+    async def trim_audio_async(self, file_path: Union[str, Path], start_time: float, end_time: float) -> str:
+        """
+        Async version of trim_audio that doesn't block the event loop while
+        ffprobe or ffmpeg runs.
+        
+        Args:
+            file_path: Path to the audio file
+            start_time: Start time in seconds
+            end_time: End time in seconds
+            
+        Returns:
+            Path to the trimmed file as string
+        """
+        try:
+            start_time, end_time = await _run_blocking(self._validate_trim_bounds, file_path, start_time, end_time)
+            output_path = await self.trim_async(file_path, start_time, end_time)
+            return str(output_path)
+        except Exception as e:
+            logger.error(f"Error in trim_audio: {str(e)}")
+            raise
+    
+    def _validate_trim_bounds(self, file_path: Union[str, Path], start_time: float, end_time: float) -> Tuple[float, float]:
+        """
+        Check that a file exists and clamp trim times to its duration.
+        
+        Args:
+            file_path: Path to the audio file
+            start_time: Start time in seconds
+            end_time: End time in seconds
+            
+        Returns:
+            Tuple of the validated start and end times
+        """
+        # Ensure file exists
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+            
+        # Validate time values
+        if start_time < 0:
+            start_time = 0
+            
+        # Get file duration
+        duration = self.get_duration(file_path)
+        if duration:
+            if end_time > duration:
+                end_time = duration
+                
+            if start_time >= end_time:
+                logger.warning("Error checking duration: Start time must be less than end time")
+        
+        return start_time, end_time
+    
     def merge_segments(self, segments, padding_seconds=3.0):
         """
         Merge close segments and add padding.
@@ -354,34 +929,32 @@ class AudioProcessor:
         """
         if not segments:
             return []
-            
-        # Sort segments by start time
-        sorted_segments = sorted(segments, key=lambda x: x['start'])
         
-        # Add padding to each segment
-        padded_segments = []
-        for segment in sorted_segments:
-            padded_segments.append({
-                'start': max(0, segment['start'] - padding_seconds),
-                'end': segment['end'] + padding_seconds,
-                'text': segment.get('text', '')
-            })
+        # Sort segments by start time and add padding
+        starts = np.fromiter((s['start'] for s in segments), dtype=float, count=len(segments))
+        ends = np.fromiter((s['end'] for s in segments), dtype=float, count=len(segments))
+        order = np.argsort(starts, kind='stable')
+        starts = np.maximum(starts[order] - padding_seconds, 0)
+        ends = ends[order] + padding_seconds
         
-        # Merge overlapping segments
-        merged_segments = []
-        current = padded_segments[0]
+        # A segment starts a new group when it begins after every earlier
+        # segment has ended; otherwise it overlaps and is merged
+        running_end = np.maximum.accumulate(ends)
+        new_group = np.concatenate(([True], starts[1:] > running_end[:-1]))
+        boundaries = np.flatnonzero(new_group)
+        group_starts = starts[boundaries]
+        group_ends = np.maximum.reduceat(ends, boundaries)
         
-        for next_segment in padded_segments[1:]:
-            # If segments overlap, merge them
-            if next_segment['start'] <= current['end']:
-                current['end'] = max(current['end'], next_segment['end'])
-                current['text'] = current['text'] + ' ' + next_segment['text']
-            else:
-                merged_segments.append(current)
-                current = next_segment
-        
-        # Add the last segment
-        merged_segments.append(current)
+        # Join the text of each group
+        texts = [segments[i].get('text', '') for i in order]
+        group_bounds = list(boundaries) + [len(texts)]
+        merged_segments = []
+        for g, (start, end) in enumerate(zip(group_starts.tolist(), group_ends.tolist())):
+            merged_segments.append({
+                'start': start,
+                'end': end,
+                'text': ' '.join(texts[group_bounds[g]:group_bounds[g + 1]])
+            })
         
         return merged_segments
     
@@ -397,49 +970,56 @@ class AudioProcessor:
             Path to the output file
         """
         try:
-            if not segments:
-                raise ValueError("No segments provided for trimming")
-                
-            # Ensure file exists
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File not found: {file_path}")
+            # Just one segment, use the trim method
+            if segments and len(segments) == 1:
+                return self.trim_audio(file_path, segments[0]['start'], segments[0]['end'])
             
-            file_path = Path(file_path)
+            file_path, bounds, output_path = self._prepare_highlights(file_path, segments)
+            span = self._covering_span(file_path, bounds)
+            if span:
+                return self.trim_audio(file_path, *span)
+            if output_path.exists():
+                logger.info(f"Reusing highlights audio file: {output_path}")
+                return str(output_path)
             
-            # Create output file path
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_dir = file_path.parent
-            output_filename = f"{file_path.stem}_highlights_{timestamp}{file_path.suffix}"
-            output_path = output_dir / output_filename
+            with _partial_output(output_path) as partial_path:
+                _run_command_batches(self._highlight_commands(file_path, bounds, partial_path))
             
-            # Check if we need to create a temp file for intermediate steps
-            if len(segments) == 1:
-                # Just one segment, use the trim method
-                return self.trim_audio(file_path, segments[0]['start'], segments[0]['end'])
+            logger.info(f"Created highlights audio file: {output_path}")
+            return str(output_path)
+            
+        except Exception as e:
+            logger.error(f"Error creating highlights: {str(e)}")
+            raise
+
+    async def trim_to_highlights_async(self, file_path: Union[str, Path], segments) -> str:
+        """
+        Async version of trim_to_highlights that doesn't block the event loop
+        while ffprobe or ffmpeg runs.
+        
+        Args:
+            file_path: Path to the audio file
+            segments: List of segments with start and end times to include
             
-            # For multiple segments, we'll use pydub to concatenate
-            audio = AudioSegment.from_file(str(file_path))
+        Returns:
+            Path to the output file
+        """
+        try:
+            # Just one segment, use the trim method
+            if segments and len(segments) == 1:
+                return await self.trim_audio_async(file_path, segments[0]['start'], segments[0]['end'])
             
-            # Extract and concatenate segments
-            output_audio = AudioSegment.empty()
-            for segment in segments:
-                start_ms = int(segment['start'] * 1000)
-                end_ms = int(segment['end'] * 1000)
-                
-                # Validate time bounds
-                start_ms = max(0, start_ms)
-                end_ms = min(len(audio), end_ms)
-                
-                if start_ms >= end_ms:
-                    logger.warning(f"Invalid segment: start {start_ms}ms >= end {end_ms}ms, skipping")
-                    continue
-                
-                # Extract segment and add to output
-                segment_audio = audio[start_ms:end_ms]
-                output_audio += segment_audio
+            # Validating the segments probes the file, so it runs in the pool
+            file_path, bounds, output_path = await _run_blocking(self._prepare_highlights, file_path, segments)
+            span = await _run_blocking(self._covering_span, file_path, bounds)
+            if span:
+                return await self.trim_audio_async(file_path, *span)
+            if output_path.exists():
+                logger.info(f"Reusing highlights audio file: {output_path}")
+                return str(output_path)
             
-            # Export the concatenated audio
-            output_audio.export(str(output_path), format=file_path.suffix[1:])
+            with _partial_output(output_path) as partial_path:
+                await _run_command_batches_async(self._highlight_commands(file_path, bounds, partial_path))
             
             logger.info(f"Created highlights audio file: {output_path}")
             return str(output_path)
@@ -447,3 +1027,193 @@ class AudioProcessor:
         except Exception as e:
             logger.error(f"Error creating highlights: {str(e)}")
             raise
+
+    def _prepare_highlights(self, file_path: Union[str, Path], segments) -> Tuple[Path, List[Tuple[float, float]], Path]:
+        """
+        Validate highlight segments against the file and choose the output path.
+        
+        Args:
+            file_path: Path to the audio file
+            segments: List of segments with start and end times to include
+            
+        Returns:
+            Tuple of the file path, the (start, end) bounds to keep and the output path
+        """
+        if not segments:
+            raise ValueError("No segments provided for trimming")
+            
+        # Ensure file exists
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        file_path = Path(file_path)
+        
+        # Validate time bounds
+        duration = self.get_duration(file_path)
+        bounds = []
+        for segment in segments:
+            start = max(0.0, float(segment['start']))
+            end = float(segment['end'])
+            if duration:
+                end = min(duration, end)
+            
+            if start >= end:
+                logger.warning(f"Invalid segment: start {start}s >= end {end}s, skipping")
+                continue
+            bounds.append((start, end))
+        
+        if not bounds:
+            raise ValueError("No valid segments to include in highlights")
+        
+        output_path = self._output_path(file_path, "highlights", bounds)
+        return file_path, bounds, output_path
+
+    def _covering_span(self, file_path: Path, bounds) -> Optional[Tuple[float, float]]:
+        """
+        Get a single span to trim instead of joining segments, when the
+        segments form one interval or cover nearly the whole file (the small
+        gaps between them are then kept).
+        
+        Args:
+            file_path: Path to the audio file
+            bounds: List of (start, end) times in seconds
+            
+        Returns:
+            (start, end) of the span, or None if the segments should be joined
+        """
+        if len(bounds) == 1:
+            return bounds[0]
+        
+        duration = self.get_duration(file_path)
+        covered = sum(end - start for start, end in bounds)
+        if duration and covered / duration >= HIGHLIGHT_COVERAGE_THRESHOLD:
+            return min(start for start, _ in bounds), max(end for _, end in bounds)
+        return None
+
+    def _highlight_commands(self, file_path: Path, bounds, output_path: Path) -> Iterator[List[List[str]]]:
+        """
+        Generate the ffmpeg commands that build a highlight reel, as batches
+        whose commands may run in parallel. Temporary files are removed once
+        the generator finishes.
+        
+        Formats that allow it are joined by the concat demuxer with stream
+        copy. Others are re-encoded by one ffmpeg run using the concat filter
+        or, with HIGHLIGHT_PARALLEL_PARTS, by one ffmpeg process per segment
+        whose parts are then joined by stream copy. Both fade each segment.
+        
+        Args:
+            file_path: Path to the audio file
+            bounds: List of (start, end) times in seconds
+            output_path: Path to write the result to
+        """
+        if file_path.suffix.lower() in STREAM_COPY_SUFFIXES:
+            yield from self._concat_demux_commands(
+                [(file_path, start, end) for start, end in bounds], output_path)
+            return
+        
+        # Re-encode at the source bit rate rather than the encoder's default
+        encode_args = self._encode_args(file_path)
+        
+        if HIGHLIGHT_PARALLEL_PARTS and AUDIO_WORKERS > 1 and len(bounds) > 1:
+            # Share the cores between the part encodes that run at once
+            part_threads = _ffmpeg_threads(min(len(bounds), AUDIO_WORKERS))
+            with tempfile.TemporaryDirectory() as temp_dir:
+                part_paths = [Path(temp_dir) / f"part_{i:04d}{file_path.suffix}" for i in range(len(bounds))]
+                yield [
+                    _fade_segment(ffmpeg.input(str(file_path), ss=start, to=end).audio, end - start)
+                    .output(str(part_path), threads=part_threads, **encode_args)
+                    .overwrite_output()
+                    .compile()
+                    for (start, end), part_path in zip(bounds, part_paths)
+                ]
+                yield from self._concat_demux_commands(
+                    [(part_path, None, None) for part_path in part_paths], output_path)
+            return
+        
+        yield [
+            self._concat_graph(file_path, bounds)
+            .output(str(output_path), threads=_ffmpeg_threads(), **encode_args)
+            .overwrite_output()
+            .compile()
+        ]
+
+    def _encode_args(self, file_path: Path) -> Dict:
+        """
+        Get output arguments that keep a re-encode at the source's bit rate.
+        
+        Args:
+            file_path: Path to the audio file
+            
+        Returns:
+            ffmpeg output arguments (empty if the bit rate is unknown)
+        """
+        try:
+            probe = self.probe(file_path, "format=bit_rate:stream=bit_rate")
+        except Exception as e:
+            logger.warning(f"Error getting bit rate for {file_path}: {str(e)}")
+            return {}
+        streams = probe.get('streams', [])
+        for value in (streams[0].get('bit_rate') if streams else None, probe.get('format', {}).get('bit_rate')):
+            if value not in (None, 'N/A', '0'):
+                return {"audio_bitrate": int(value)}
+        return {}
+
+    def _concat_graph(self, file_path: Union[str, Path], bounds, gap_seconds: float = 0.0):
+        """
+        Build one ffmpeg filter graph that cuts, fades, pads and joins
+        segments of a file, so they are decoded and encoded in a single pass.
+        Each segment is its own seeked input, so only the kept parts of the
+        file are decoded (atrim on a single input would decode all of it).
+        
+        Args:
+            file_path: Path to the audio file
+            bounds: List of (start, end) times in seconds
+            gap_seconds: Silence to insert between segments
+            
+        Returns:
+            Audio stream node of the joined segments
+        """
+        streams = []
+        for i, (start, end) in enumerate(bounds):
+            stream = ffmpeg.input(str(file_path), ss=start, to=end).audio
+            
+            # Timestamps of a seeked input start at zero
+            stream = _fade_segment(stream, end - start)
+            
+            # Add a short silence between segments, except after the last one
+            if gap_seconds and i < len(bounds) - 1:
+                stream = stream.filter('apad', pad_dur=gap_seconds)
+            streams.append(stream)
+        
+        return ffmpeg.concat(*streams, v=0, a=1)
+
+    def _concat_demux_commands(self, entries, output_path: Path) -> Iterator[List[List[str]]]:
+        """
+        Generate the concat demuxer command that joins a list of inputs with
+        stream copy; its list file is removed once the generator finishes.
+        
+        Args:
+            entries: List of (path, inpoint, outpoint); None points use the whole file
+            output_path: Path to write the result to
+        """
+        list_fd, list_path = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(list_fd, "w") as f:
+                for path, inpoint, outpoint in entries:
+                    # Quote the path for the concat list ('\'' closes, escapes and reopens)
+                    quoted_path = str(Path(path).resolve()).replace("'", "'\\''")
+                    f.write(f"file '{quoted_path}'\n")
+                    if inpoint is not None:
+                        f.write(f"inpoint {inpoint}\n")
+                    if outpoint is not None:
+                        f.write(f"outpoint {outpoint}\n")
+            
+            yield [
+                ffmpeg
+                .input(list_path, f="concat", safe=0)
+                .output(str(output_path), c="copy", threads=_ffmpeg_threads())
+                .overwrite_output()
+                .compile()
+            ]
+        finally:
+            os.remove(list_path)
@@ -0,0 +1,87 @@
+"""
+Process pool for CPU-bound text analysis.
+Extractive summarization and topic detection are pure CPU work, so running
+them in worker processes lets several jobs use separate cores instead of
+contending for the API process's GIL. Each worker builds its own processors
+once and reuses them for every task.
+"""
+
+import functools
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def _get_extractive_summarizer():
+    try:
+        from summarization import ExtractiveSummarizer
+    except ImportError:
+        from backend.summarization import ExtractiveSummarizer
+    return ExtractiveSummarizer()
+
+
+@functools.cache
+def _get_topic_detector():
+    try:
+        from topic_detection import TopicDetector
+    except ImportError:
+        from backend.topic_detection import TopicDetector
+    return TopicDetector()
+
+
+def _preload_processors():
+    """
+    Worker initializer: make sure NLTK data is present and build the
+    processors before the first task arrives.
+    """
+    try:
+        try:
+            from init_nltk import download_nltk_data
+        except ImportError:
+            from backend.init_nltk import download_nltk_data
+        download_nltk_data()
+    except Exception as e:
+        logger.error(f"Failed to download NLTK data in CPU worker: {str(e)}")
+
+    for getter in (_get_extractive_summarizer, _get_topic_detector):
+        try:
+            getter()
+        except Exception as e:
+            logger.error(f"Error preloading processor in CPU worker: {str(e)}")
+
+
+def extractive_summarize(transcript: str) -> Dict:
+    """Run the worker's ExtractiveSummarizer on a transcript."""
+    return _get_extractive_summarizer().summarize(transcript)
+
+
+def detect_topics(transcript: str) -> List[Dict]:
+    """Run the worker's TopicDetector on a transcript."""
+    return _get_topic_detector().detect_topics(transcript)
+
+
+def create_cpu_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Create the process pool for CPU-bound analysis.
+
+    Args:
+        max_workers: Number of worker processes (defaults to one less than
+            the number of CPUs, leaving a core for the API process)
+
+    Returns:
+        ProcessPoolExecutor whose workers have their processors preloaded
+    """
+    if max_workers is None:
+        max_workers = max(1, (multiprocessing.cpu_count() or 2) - 1)
+
+    # Spawn rather than fork so workers don't inherit the API's threads and locks
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_preload_processors
+    )
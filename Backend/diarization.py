@@ -5,16 +5,17 @@ This module provides advanced speaker diarization capabilities.
 
 import os
 import json
+import importlib.util
 import logging
-import tempfile
+import threading
 from pathlib import Path
 import torch
-from typing import Dict, List, Any, Optional, Tuple, Union
+import torchaudio
+from typing import TYPE_CHECKING, ClassVar, Dict, List, Any, Optional, Tuple, Union
 import numpy as np
 from pydub import AudioSegment
-import matplotlib.pyplot as plt
-from matplotlib.colors import to_hex
 import io
+from PIL import Image, ImageDraw, ImageFont
 import base64
 import traceback
 
@@ -29,20 +30,67 @@ if not HF_ACCESS_TOKEN or HF_ACCESS_TOKEN.strip() == "":
     logger.warning("Get a token at: https://huggingface.co/settings/tokens")
     logger.warning("And accept the user conditions at: https://huggingface.co/pyannote/speaker-diarization-3.1")
 
-try:
+# pyannote.audio is imported when the pipeline is built, so importing this
+# module stays cheap for processes that never diarize
+if TYPE_CHECKING:
     from pyannote.audio import Pipeline
-    from pyannote.core import Segment, Timeline, Annotation
-    PYANNOTE_AVAILABLE = True
-except ImportError:
+    from pyannote.core import Annotation
+
+# find_spec on a submodule raises if the parent package is missing
+PYANNOTE_AVAILABLE = (importlib.util.find_spec("pyannote") is not None
+                      and importlib.util.find_spec("pyannote.audio") is not None)
+if not PYANNOTE_AVAILABLE:
     logger.warning("pyannote.audio not properly installed. Speaker diarization will be disabled.")
     logger.warning("Install with: pip install pyannote.audio>=3.1.0")
-    PYANNOTE_AVAILABLE = False
+
+# Sample rate of the waveforms given to the pipeline
+DIARIZATION_SAMPLE_RATE = 16000
+
+# Windows fed to the segmentation and embedding models per forward pass.
+# Fixed-size batches keep memory use flat however long the audio is.
+SEGMENTATION_BATCH_SIZE = int(os.environ.get("DIARIZATION_SEGMENTATION_BATCH_SIZE", 32))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("DIARIZATION_EMBEDDING_BATCH_SIZE", 32))
+
+# Run the models under FP16 autocast on CUDA; BF16 on CPU is opt-in since
+# it is only faster on CPUs with native BF16 support (e.g. AMX)
+DIARIZATION_AUTOCAST = os.environ.get("DIARIZATION_AUTOCAST", "true").lower() == "true"
+DIARIZATION_CPU_BF16 = os.environ.get("DIARIZATION_CPU_BF16", "false").lower() == "true"
+
+# Quantize the models' Linear and LSTM weights to INT8 when running on CPU
+DIARIZATION_CPU_INT8 = os.environ.get("DIARIZATION_CPU_INT8", "true").lower() == "true"
+
+# Compile the segmentation model with torch.compile (opt-in: compilation
+# adds start-up time and happens on the first diarization)
+DIARIZATION_COMPILE = os.environ.get("DIARIZATION_COMPILE", "false").lower() == "true"
+
+# Share of free VRAM a single chunk may be sized to use
+VRAM_HEADROOM = 0.8
+
+# Clip lengths (seconds) of the warm-up runs that measure how peak VRAM
+# grows with the length of the audio
+VRAM_PROBE_SECONDS = (30, 60)
+
+# Size in pixels of the speaker timeline image
+WAVEFORM_SIZE = (1200, 300)
+
+def _blend_on_white(color: str, alpha: float = 0.7) -> Tuple[int, int, int]:
+    """Blend a hex color onto white, as if drawn with the given opacity"""
+    rgb = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return tuple(round(alpha * c + (1 - alpha) * 255) for c in rgb)
 
 class SpeakerDiarization:
     """
     Speaker diarization processor using pyannote.audio.
     """
     
+    # Pipelines are shared by every instance using the same token and device,
+    # so the models are only loaded (and moved to the GPU) once per process
+    _pipeline_cache: ClassVar[Dict[Tuple[str, str], 'Pipeline']] = {}
+    _pipeline_cache_lock: ClassVar[threading.Lock] = threading.Lock()
+    
+    # A pipeline is not safe to run from several threads at once
+    _pipeline_run_lock: ClassVar[threading.Lock] = threading.Lock()
+    
     def __init__(self, use_auth_token: Optional[str] = None):
         """
         Initialize the speaker diarization processor.
@@ -50,7 +98,12 @@ class SpeakerDiarization:
         Args:
             use_auth_token: Hugging Face access token. If None, will use the HF_ACCESS_TOKEN env var.
         """
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        if torch.cuda.is_available():
+            self.device = "cuda"
+        elif torch.backends.mps.is_available():
+            self.device = "mps"
+        else:
+            self.device = "cpu"
         logger.info(f"Initializing pyannote.audio speaker diarization on {self.device}")
         
         # Default configuration
@@ -69,6 +122,18 @@ class SpeakerDiarization:
             "#9E9E9E", "#607D8B", "#1DE9B6", "#6200EA"
         ]
         
+        # Reduced-precision autocast, switched off if the pipeline fails under it
+        self.autocast_dtype = None
+        if DIARIZATION_AUTOCAST:
+            if self.device == "cuda":
+                self.autocast_dtype = torch.float16
+            elif self.device == "cpu" and DIARIZATION_CPU_BF16:
+                self.autocast_dtype = torch.bfloat16
+        
+        # Fixed and per-second peak VRAM of a pipeline run, measured once by
+        # warm-up runs (see _measure_vram)
+        self._vram_usage = None
+        
         # Only initialize pipeline if token is available and pyannote is installed
         self.pipeline = None
         if PYANNOTE_AVAILABLE and self.auth_token and self.auth_token.strip() != "":
@@ -83,9 +148,10 @@ class SpeakerDiarization:
         elif not self.auth_token or self.auth_token.strip() == "":
             logger.error("No Hugging Face access token provided. Speaker diarization will be disabled.")
     
-    def _init_pipeline(self) -> Pipeline:
+    def _init_pipeline(self) -> 'Pipeline':
         """
-        Initialize the pyannote.audio pipeline.
+        Initialize the pyannote.audio pipeline, reusing one already loaded
+        for the same token and device.
         
         Returns:
             The diarization pipeline.
@@ -96,7 +162,22 @@ class SpeakerDiarization:
         if not PYANNOTE_AVAILABLE:
             raise ImportError("pyannote.audio is not properly installed")
         
+        key = (self.auth_token, self.device)
+        with self._pipeline_cache_lock:
+            if key not in self._pipeline_cache:
+                self._pipeline_cache[key] = self._load_pipeline()
+            return self._pipeline_cache[key]
+    
+    def _load_pipeline(self) -> 'Pipeline':
+        """
+        Load the pyannote.audio pipeline and prepare it for this device.
+        
+        Returns:
+            The diarization pipeline.
+        """
         try:
+            from pyannote.audio import Pipeline
+            
             # Load the pre-trained pipeline from HuggingFace
             pipeline = Pipeline.from_pretrained(
                 "pyannote/speaker-diarization-3.1",
@@ -106,41 +187,221 @@ class SpeakerDiarization:
             # Move to appropriate device
             pipeline.to(torch.device(self.device))
             
+            # Run the models on mini-batches of windows rather than one at a time
+            if hasattr(pipeline, "segmentation_batch_size"):
+                pipeline.segmentation_batch_size = SEGMENTATION_BATCH_SIZE
+            if hasattr(pipeline, "embedding_batch_size"):
+                pipeline.embedding_batch_size = EMBEDDING_BATCH_SIZE
+            
+            quantized = self.device == "cpu" and DIARIZATION_CPU_INT8
+            if quantized:
+                self._quantize_models(pipeline)
+            
+            if DIARIZATION_COMPILE and not quantized:
+                self._compile_segmentation(pipeline)
+            
             return pipeline
         except Exception as e:
             logger.error(f"Error loading pyannote.audio model: {str(e)}")
             raise
     
-    def _prepare_audio(self, audio_file: Union[str, Path]) -> Path:
+    def _quantize_models(self, pipeline: 'Pipeline'):
+        """
+        Apply dynamic INT8 quantization to the segmentation and embedding
+        models for faster CPU inference. Models that can't be quantized are
+        left in FP32.
+        
+        Args:
+            pipeline: The diarization pipeline.
+        """
+        targets = [
+            (getattr(pipeline, "_segmentation", None), "model"),
+            (getattr(pipeline, "_embedding", None), "model_"),
+        ]
+        for owner, attribute in targets:
+            model = getattr(owner, attribute, None)
+            if not isinstance(model, torch.nn.Module):
+                continue
+            try:
+                setattr(owner, attribute, torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+                ))
+                logger.info(f"Quantized {type(model).__name__} to INT8")
+            except Exception as e:
+                logger.warning(f"Could not quantize {type(model).__name__}, keeping FP32: {e}")
+    
+    def _compile_segmentation(self, pipeline: 'Pipeline'):
         """
-        Prepare audio for diarization by ensuring it's in the right format.
+        Replace the segmentation model with a torch.compile'd version, which
+        cuts the per-window Python overhead of eager mode. Uses CUDA graphs
+        ("reduce-overhead") on GPU.
+        
+        Args:
+            pipeline: The diarization pipeline.
+        """
+        segmentation = getattr(pipeline, "_segmentation", None)
+        model = getattr(segmentation, "model", None)
+        if not isinstance(model, torch.nn.Module) or not hasattr(torch, "compile"):
+            return
+        
+        mode = "reduce-overhead" if self.device == "cuda" else "default"
+        try:
+            segmentation.model = torch.compile(model, mode=mode, dynamic=True)
+            logger.info(f"Compiled segmentation model ({mode})")
+        except Exception as e:
+            logger.warning(f"Could not compile segmentation model, using eager mode: {e}")
+    
+    def _prepare_audio(self, audio_file: Union[str, Path]) -> Tuple[torch.Tensor, int]:
+        """
+        Decode audio once into the mono 16kHz waveform the pipeline expects,
+        so pyannote doesn't have to re-open and re-decode a file.
         
         Args:
             audio_file: Path to the audio file.
             
         Returns:
-            Path to the prepared audio file.
+            Tuple of the (1, samples) waveform tensor and its sample rate.
+        """
+        try:
+            waveform, sample_rate = torchaudio.load(str(audio_file))
+        except Exception as e:
+            # Fall back to pydub for formats torchaudio's backend can't read
+            logger.warning(f"torchaudio could not load {audio_file}, decoding with pydub: {e}")
+            audio = AudioSegment.from_file(str(audio_file)).set_channels(1)
+            samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+            samples /= float(1 << (8 * audio.sample_width - 1))
+            waveform, sample_rate = torch.from_numpy(samples).unsqueeze(0), audio.frame_rate
+        
+        # Downmix to mono
+        if waveform.shape[0] > 1:
+            waveform = waveform.mean(0, keepdim=True)
+        
+        # Resample on the pipeline's device, which is much faster on GPU
+        if sample_rate != DIARIZATION_SAMPLE_RATE:
+            waveform = torchaudio.functional.resample(
+                waveform.to(self.device), sample_rate, DIARIZATION_SAMPLE_RATE
+            ).cpu()
+        
+        return waveform, DIARIZATION_SAMPLE_RATE
+    
+    def _run_pipeline(self, waveform: torch.Tensor, sample_rate: int,
+                      min_speakers: int, max_speakers: int) -> 'Annotation':
+        """
+        Run the pipeline on a waveform without autograd and, where enabled,
+        under reduced-precision autocast. Falls back to FP32 for good if
+        the pipeline fails under autocast.
+        
+        Args:
+            waveform: (1, samples) waveform tensor
+            sample_rate: Sample rate of the waveform
+            min_speakers: Minimum number of speakers
+            max_speakers: Maximum number of speakers
+            
+        Returns:
+            Diarization annotation from pyannote.
         """
-        audio_file = Path(audio_file)
+        with self._pipeline_run_lock:
+            return self._run_pipeline_locked(waveform, sample_rate, min_speakers, max_speakers)
+    
+    def _run_pipeline_locked(self, waveform: torch.Tensor, sample_rate: int,
+                             min_speakers: int, max_speakers: int) -> 'Annotation':
+        """Body of _run_pipeline, called with the pipeline lock held"""
+        audio = {"waveform": waveform, "sample_rate": sample_rate}
         
-        # If file is already WAV, just return it
-        if audio_file.suffix.lower() == '.wav':
-            return audio_file
+        diarization = None
+        if self.autocast_dtype is not None:
+            try:
+                with torch.inference_mode(), torch.autocast(device_type=self.device, dtype=self.autocast_dtype):
+                    diarization = self.pipeline(audio, min_speakers=min_speakers, max_speakers=max_speakers)
+            except RuntimeError as e:
+                logger.warning(f"Diarization failed under {self.autocast_dtype} autocast, using FP32: {e}")
+                self.autocast_dtype = None
         
-        # Otherwise convert to WAV
-        logger.info(f"Converting {audio_file} to WAV format for diarization")
-        temp_wav = Path(tempfile.gettempdir()) / f"{audio_file.stem}_diarize.wav"
+        if diarization is None:
+            with torch.inference_mode():
+                diarization = self.pipeline(audio, min_speakers=min_speakers, max_speakers=max_speakers)
         
-        try:
-            audio = AudioSegment.from_file(str(audio_file))
-            audio = audio.set_channels(1)  # Convert to mono
-            audio = audio.set_frame_rate(16000)  # Set sample rate to 16kHz
-            audio.export(str(temp_wav), format="wav")
-            return temp_wav
-        except Exception as e:
-            logger.error(f"Error preparing audio: {e}")
-            # Return original file as fallback
-            return audio_file
+        return diarization
+    
+    def _measure_vram(self, waveform: torch.Tensor, sample_rate: int,
+                      min_speakers: int, max_speakers: int) -> Tuple[float, float]:
+        """
+        Measure the pipeline's peak VRAM with warm-up runs on the start of
+        the audio, one per VRAM_PROBE_SECONDS clip length. Embeddings run in
+        fixed-size batches, so the peak is fitted as a fixed part plus a part
+        that grows with each second of audio. The runs hold the pipeline lock
+        so no other diarization adds to the measured peaks.
+        
+        Args:
+            waveform: (1, samples) waveform tensor, at least as long as the
+                longest probe clip
+            sample_rate: Sample rate of the waveform
+            min_speakers: Minimum number of speakers
+            max_speakers: Maximum number of speakers
+            
+        Returns:
+            Tuple of the fixed bytes and the bytes per second of audio.
+        """
+        peaks = []
+        with self._pipeline_run_lock:
+            for seconds in VRAM_PROBE_SECONDS:
+                clip = waveform[:, :int(seconds * sample_rate)]
+                torch.cuda.synchronize()
+                baseline = torch.cuda.memory_allocated()
+                torch.cuda.reset_peak_memory_stats()
+                self._run_pipeline_locked(clip, sample_rate, min_speakers, max_speakers)
+                torch.cuda.synchronize()
+                peaks.append(max(torch.cuda.max_memory_allocated() - baseline, 0))
+        
+        (short, long), (short_peak, long_peak) = VRAM_PROBE_SECONDS, peaks
+        per_second = max((long_peak - short_peak) / (long - short), 0.0)
+        fixed = max(short_peak - per_second * short, 0.0)
+        logger.info(f"Diarization VRAM: {fixed / 2**20:.0f} MiB fixed, {per_second / 2**20:.2f} MiB per second of audio")
+        return fixed, per_second
+    
+    def _pick_chunk_seconds(self, waveform: torch.Tensor, sample_rate: int,
+                            min_speakers: int, max_speakers: int,
+                            max_duration: Optional[int]) -> Optional[int]:
+        """
+        Choose the chunk length for a diarization run: the caller's
+        max_duration, shortened on CUDA if a chunk that long would not fit in
+        the free VRAM. Without a max_duration the file is processed whole,
+        unless on CUDA it would not fit in the free VRAM either.
+        
+        Args:
+            waveform: (1, samples) waveform tensor
+            sample_rate: Sample rate of the waveform
+            min_speakers: Minimum number of speakers
+            max_speakers: Maximum number of speakers
+            max_duration: Maximum chunk duration requested by the caller
+            
+        Returns:
+            Chunk length in seconds, or None to process the file whole.
+        """
+        if max_duration is not None and max_duration <= 0:
+            max_duration = None
+        if self.device != "cuda":
+            return max_duration
+        
+        if self._vram_usage is None:
+            # The warm-up needs audio as long as the longest probe clip
+            if waveform.shape[1] < VRAM_PROBE_SECONDS[-1] * sample_rate:
+                return max_duration
+            try:
+                self._vram_usage = self._measure_vram(waveform, sample_rate, min_speakers, max_speakers)
+            except Exception as e:
+                logger.warning(f"Could not measure diarization VRAM use: {e}")
+                self._vram_usage = (0.0, 0.0)
+        
+        fixed, per_second = self._vram_usage
+        if per_second <= 0:
+            return max_duration
+        
+        free, _ = torch.cuda.mem_get_info()
+        fits = max(int((free * VRAM_HEADROOM - fixed) / per_second), VRAM_PROBE_SECONDS[0])
+        if max_duration is None:
+            return fits if fits * sample_rate < waveform.shape[1] else None
+        return min(max_duration, fits)
     
     def diarize(self, 
                 audio_file: Union[str, Path], 
@@ -188,31 +449,21 @@ class SpeakerDiarization:
                 min_speakers = num_speakers
                 max_speakers = num_speakers
             
-            # Prepare audio file
-            prepared_audio = self._prepare_audio(audio_file)
+            # Decode the audio once
+            waveform, sample_rate = self._prepare_audio(audio_file)
             
             # Check if we need to process in chunks
-            if max_duration and max_duration > 0:
-                try:
-                    from pydub import AudioSegment
-                    audio = AudioSegment.from_file(str(prepared_audio))
-                    total_duration = len(audio) / 1000  # Convert to seconds
-                    
-                    if total_duration > max_duration:
-                        logger.info(f"Processing long audio ({total_duration:.1f}s) in chunks of {max_duration}s")
-                        return self._process_in_chunks(audio, max_duration, min_speakers, max_speakers)
-                except Exception as e:
-                    logger.warning(f"Error checking audio duration, processing full file: {e}")
+            total_duration = waveform.shape[1] / sample_rate
+            chunk_seconds = self._pick_chunk_seconds(waveform, sample_rate, min_speakers, max_speakers, max_duration)
+            if chunk_seconds and chunk_seconds > 0 and total_duration > chunk_seconds:
+                logger.info(f"Processing long audio ({total_duration:.1f}s) in chunks of {chunk_seconds}s")
+                return self._process_in_chunks(waveform, sample_rate, chunk_seconds, min_speakers, max_speakers)
             
             # Suppress warnings from pyannote
             logger.info(f"Running diarization with {min_speakers}-{max_speakers} speakers")
             
             # Run diarization
-            diarization = self.pipeline(
-                prepared_audio,
-                min_speakers=min_speakers,
-                max_speakers=max_speakers
-            )
+            diarization = self._run_pipeline(waveform, sample_rate, min_speakers, max_speakers)
             
             # Process results with improved segment merging
             segments = self._process_diarization_results(diarization)
@@ -221,10 +472,6 @@ class SpeakerDiarization:
             if is_youtube_shorts and num_speakers == 2:
                 segments = self._enforce_two_speakers(segments)
             
-            # Clean up temp file if created
-            if prepared_audio != Path(audio_file) and prepared_audio.exists():
-                os.unlink(prepared_audio)
-            
             logger.info(f"Diarization complete: {len(segments)} segments, {len(set(s['speaker'] for s in segments))} speakers")
             
             return segments
@@ -242,7 +489,7 @@ class SpeakerDiarization:
                 "error": f"Diarization failed: {str(e)}"
             }]
     
-    def _process_diarization_results(self, diarization: Annotation) -> List[Dict[str, Any]]:
+    def _process_diarization_results(self, diarization: 'Annotation') -> List[Dict[str, Any]]:
         """
         Process diarization results with improved segment merging logic.
         Combines consecutive segments from the same speaker if gap is small.
@@ -253,52 +500,136 @@ class SpeakerDiarization:
         Returns:
             List of processed segments with merged close segments.
         """
-        raw_segments = []
-        
-        # First, collect all segments
-        for turn, _, speaker in diarization.itertracks(yield_label=True):
-            segment = {
-                "start": round(turn.start, 2),
-                "end": round(turn.end, 2),
-                "speaker": f"Speaker {int(speaker.split('_')[1]) + 1}",  # Convert from speaker_0 to Speaker 1
-                "duration": round(turn.end - turn.start, 2)
-            }
-            raw_segments.append(segment)
+        tracks = list(diarization.itertracks(yield_label=True))
+        if not tracks:
+            return []
+        
+        # Collect the turns as columns, with speakers encoded as indices
+        # into a table of display names
+        starts = np.array([turn.start for turn, _, _ in tracks], dtype=float)
+        ends = np.array([turn.end for turn, _, _ in tracks], dtype=float)
+        labels, speaker_codes = np.unique([label for _, _, label in tracks], return_inverse=True)
+        # Convert from speaker_0 to Speaker 1
+        speaker_names = [f"Speaker {int(label.split('_')[1]) + 1}" for label in labels.tolist()]
         
         # Sort by start time
-        sorted_segments = sorted(raw_segments, key=lambda s: s["start"])
+        order = np.argsort(starts, kind='stable')
+        durations = np.round(ends[order] - starts[order], 2)
+        starts = np.round(starts[order], 2)
+        ends = np.round(ends[order], 2)
+        speaker_codes = speaker_codes[order]
         
         # Merge close segments from the same speaker
-        merged_segments = []
-        if not sorted_segments:
-            return merged_segments
+        firsts, lasts = self._merge_groups(starts, ends, speaker_codes)
+        merged_starts = starts[firsts]
+        merged_ends = ends[lasts]
+        merged_durations = np.where(firsts == lasts, durations[firsts], np.round(merged_ends - merged_starts, 2))
+        
+        # Estimate confidence from duration; longer segments are more reliable
+        confidences = np.round(np.clip(merged_durations / 10, 0.6, 0.9), 2)
+        
+        return [
+            {
+                "start": start,
+                "end": end,
+                "speaker": speaker_names[code],
+                "duration": duration,
+                "confidence": confidence
+            }
+            for start, end, code, duration, confidence in zip(
+                merged_starts.tolist(), merged_ends.tolist(), speaker_codes[firsts].tolist(),
+                merged_durations.tolist(), confidences.tolist()
+            )
+        ]
+    
+    def _merge_groups(self, starts: np.ndarray, ends: np.ndarray,
+                      speakers: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find runs of consecutive segments from the same speaker that are at
+        most `collar` seconds apart.
+        
+        Args:
+            starts: Segment start times, sorted
+            ends: Segment end times
+            speakers: Segment speakers (labels or codes)
             
-        current = sorted_segments[0].copy()
-        
-        for next_segment in sorted_segments[1:]:
-            # If same speaker and small gap, merge
-            if (next_segment["speaker"] == current["speaker"] and 
-                next_segment["start"] - current["end"] <= self.collar):
-                # Merge by extending current segment end time
-                current["end"] = next_segment["end"]
-                current["duration"] = round(current["end"] - current["start"], 2)
-            else:
-                # Different speaker or large gap, add current and start new segment
-                merged_segments.append(current)
-                current = next_segment.copy()
-        
-        # Add the last segment
-        merged_segments.append(current)
-        
-        # Calculate confidence scores (estimated based on duration)
-        for segment in merged_segments:
-            # Longer segments typically have higher confidence
-            base_confidence = min(0.9, max(0.6, segment["duration"] / 10))
-            # Add some randomness to simulate real confidence scores
-            segment["confidence"] = round(base_confidence + np.random.uniform(-0.1, 0.1), 2)
+        Returns:
+            Indices of the first and last segment of each run.
+        """
+        # A segment starts a new group unless it continues the previous
+        # segment's speaker within the collar
+        boundary = ~((speakers[1:] == speakers[:-1]) & (starts[1:] - ends[:-1] <= self.collar))
+        firsts = np.flatnonzero(np.concatenate(([True], boundary)))
+        lasts = np.append(firsts[1:] - 1, len(starts) - 1)
+        return firsts, lasts
+    
+    def _merge_turns(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Merge consecutive segments from the same speaker that are at most
+        `collar` seconds apart. A merged segment keeps the fields of its first
+        segment and ends where its last segment ends.
+        
+        Args:
+            segments: Segments with start, end and speaker keys.
             
+        Returns:
+            Merged segments, sorted by start time.
+        """
+        if not segments:
+            return []
+        
+        segments = sorted(segments, key=lambda s: s["start"])
+        starts = np.array([s["start"] for s in segments], dtype=float)
+        ends = np.array([s["end"] for s in segments], dtype=float)
+        speakers = np.array([s["speaker"] for s in segments])
+        firsts, lasts = self._merge_groups(starts, ends, speakers)
+        
+        merged_segments = []
+        for first, last in zip(firsts.tolist(), lasts.tolist()):
+            segment = segments[first].copy()
+            if last != first:
+                segment["end"] = segments[last]["end"]
+                segment["duration"] = round(segment["end"] - segment["start"], 2)
+            merged_segments.append(segment)
+        
         return merged_segments
     
+    def _aggregate(self, segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Collect per-speaker totals over the segments with NumPy group-by
+        (unique labels plus bincount) instead of per-segment dict updates.
+        
+        Args:
+            segments: List of diarized segments.
+            
+        Returns:
+            Dictionary with the speakers in order of first appearance, their
+            speaking times and segment counts, and the number of speaker changes.
+        """
+        if not segments:
+            return {"speakers": [], "times": {}, "counts": {}, "transitions": 0}
+        
+        durations = np.fromiter(
+            (segment.get("duration", segment["end"] - segment["start"]) for segment in segments),
+            dtype=np.float64, count=len(segments)
+        )
+        labels, first_index, inverse = np.unique(
+            [segment["speaker"] for segment in segments], return_index=True, return_inverse=True
+        )
+        inverse = inverse.ravel()
+        times = np.bincount(inverse, weights=durations, minlength=len(labels))
+        counts = np.bincount(inverse, minlength=len(labels))
+        
+        # np.unique sorts the labels; report them in order of first appearance
+        order = np.argsort(first_index)
+        speakers = labels[order].tolist()
+        return {
+            "speakers": speakers,
+            "times": dict(zip(speakers, times[order].tolist())),
+            "counts": dict(zip(speakers, counts[order].tolist())),
+            "transitions": int(np.count_nonzero(inverse[1:] != inverse[:-1]))
+        }
+    
     def _enforce_two_speakers(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Enforce exactly two speakers in the diarization result.
@@ -313,7 +644,8 @@ class SpeakerDiarization:
             return segments
         
         # Collect unique speakers
-        unique_speakers = list(set(s["speaker"] for s in segments))
+        aggregate = self._aggregate(segments)
+        unique_speakers = aggregate["speakers"]
         
         # If already have 2 speakers, return as is
         if len(unique_speakers) == 2:
@@ -321,18 +653,14 @@ class SpeakerDiarization:
         
         # If more than 2 speakers, keep only the two most frequent
         if len(unique_speakers) > 2:
-            speaker_counts = {}
-            for s in segments:
-                speaker = s["speaker"]
-                speaker_counts[speaker] = speaker_counts.get(speaker, 0) + 1
-            
             # Sort by count (descending)
-            top_speakers = sorted(speaker_counts.items(), key=lambda x: x[1], reverse=True)[:2]
+            top_speakers = sorted(aggregate["counts"].items(), key=lambda x: x[1], reverse=True)[:2]
             top_speaker_ids = [s[0] for s in top_speakers]
+            top_speaker_set = set(top_speaker_ids)
             
             # Map non-top speakers to the most similar top speaker
             for segment in segments:
-                if segment["speaker"] not in top_speaker_ids:
+                if segment["speaker"] not in top_speaker_set:
                     # Simple strategy: map to most frequent
                     segment["speaker"] = top_speaker_ids[0]
         
@@ -392,7 +720,8 @@ class SpeakerDiarization:
         return speaker_timeline 
 
     def _process_in_chunks(self, 
-                          audio: 'AudioSegment',
+                          waveform: torch.Tensor,
+                          sample_rate: int,
                           chunk_duration: int,
                           min_speakers: int,
                           max_speakers: int) -> List[Dict[str, Any]]:
@@ -400,7 +729,8 @@ class SpeakerDiarization:
         Process a long audio file in chunks to avoid memory issues.
         
         Args:
-            audio: The complete audio segment
+            waveform: The complete (1, samples) waveform
+            sample_rate: Sample rate of the waveform
             chunk_duration: Duration of each chunk in seconds
             min_speakers: Minimum number of speakers
             max_speakers: Maximum number of speakers
@@ -408,9 +738,8 @@ class SpeakerDiarization:
         Returns:
             List of merged diarized segments
         """
-        import tempfile
-        
-        total_duration = len(audio) / 1000  # Convert to seconds
+        total_samples = waveform.shape[1]
+        total_duration = total_samples / sample_rate
         chunk_count = int(total_duration / chunk_duration) + 1
         
         logger.info(f"Splitting {total_duration:.1f}s audio into {chunk_count} chunks")
@@ -419,29 +748,17 @@ class SpeakerDiarization:
         speaker_mapping = {}  # To maintain consistent speaker IDs across chunks
         
         for i in range(chunk_count):
-            start_ms = i * chunk_duration * 1000
-            end_ms = min((i + 1) * chunk_duration * 1000, len(audio))
+            start = i * chunk_duration * sample_rate
+            end = min((i + 1) * chunk_duration * sample_rate, total_samples)
             
-            if start_ms >= len(audio):
+            if start >= total_samples:
                 break
                 
-            logger.info(f"Processing chunk {i+1}/{chunk_count} ({start_ms/1000:.1f}s - {end_ms/1000:.1f}s)")
-            
-            # Extract chunk
-            chunk = audio[start_ms:end_ms]
-            
-            # Save chunk to temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                chunk_path = temp_file.name
-                chunk.export(chunk_path, format="wav")
+            logger.info(f"Processing chunk {i+1}/{chunk_count} ({start/sample_rate:.1f}s - {end/sample_rate:.1f}s)")
             
             try:
-                # Process chunk
-                diarization = self.pipeline(
-                    chunk_path,
-                    min_speakers=min_speakers,
-                    max_speakers=max_speakers
-                )
+                # Process a view of the chunk's samples
+                diarization = self._run_pipeline(waveform[:, start:end], sample_rate, min_speakers, max_speakers)
                 
                 # Process results
                 chunk_segments = self._process_diarization_results(diarization)
@@ -449,8 +766,8 @@ class SpeakerDiarization:
                 # Adjust timestamps
                 for segment in chunk_segments:
                     # Add chunk offset to timestamps
-                    segment["start"] += start_ms / 1000
-                    segment["end"] += start_ms / 1000
+                    segment["start"] += start / sample_rate
+                    segment["end"] += start / sample_rate
                     
                     # Map speaker IDs consistently across chunks
                     original_speaker = segment["speaker"]
@@ -463,33 +780,10 @@ class SpeakerDiarization:
                 
             except Exception as e:
                 logger.error(f"Error processing chunk {i+1}: {e}")
-            
-            finally:
-                # Clean up temp file
-                try:
-                    os.unlink(chunk_path)
-                except:
-                    pass
         
-        # Sort segments by start time and merge very close segments from same speaker
+        # Merge very close segments from the same speaker across chunk borders
         if all_segments:
-            all_segments.sort(key=lambda s: s["start"])
-            merged_segments = []
-            current = all_segments[0].copy()
-            
-            for next_segment in all_segments[1:]:
-                if (next_segment["speaker"] == current["speaker"] and 
-                    next_segment["start"] - current["end"] <= self.collar):
-                    # Merge by extending current segment
-                    current["end"] = next_segment["end"]
-                    current["duration"] = round(current["end"] - current["start"], 2)
-                else:
-                    # Different speaker or large gap
-                    merged_segments.append(current)
-                    current = next_segment.copy()
-            
-            # Add the last segment
-            merged_segments.append(current)
+            merged_segments = self._merge_turns(all_segments)
             
             logger.info(f"Merged chunks into {len(merged_segments)} segments with {len(speaker_mapping)} speakers")
             return merged_segments
@@ -510,59 +804,54 @@ class SpeakerDiarization:
         if not segments:
             return None
             
-        # Create figure
-        fig, ax = plt.figure(figsize=(12, 3)), plt.gca()
-        
-        # Get unique speakers
-        speakers = sorted(list(set(s["speaker"] for s in segments)))
-        speaker_colors = {speakers[i]: self.speaker_colors[i % len(self.speaker_colors)] 
-                         for i in range(len(speakers))}
+        width, height = WAVEFORM_SIZE
+        legend_height, axis_height = 40, 50
+        bar_top, bar_bottom = legend_height, height - axis_height
+        scale = width / duration if duration > 0 else 0
         
-        # Plot segments as colored blocks
-        for segment in segments:
-            speaker = segment["speaker"]
-            start = segment["start"]
-            end = segment["end"]
-            color = speaker_colors.get(speaker, "#CCCCCC")
-            
-            # Plot the segment as a colored rectangle
-            rect = plt.Rectangle((start, 0), end - start, 1, color=color, alpha=0.7)
-            ax.add_patch(rect)
-            
-            # Add speaker label for longer segments
-            if end - start > duration / 30:  # Only label longer segments
-                plt.text((start + end) / 2, 0.5, speaker, 
-                        horizontalalignment='center', verticalalignment='center')
-        
-        # Add legend
-        import matplotlib.patches as mpatches
-        handles = [mpatches.Patch(color=color, label=speaker) 
-                 for speaker, color in speaker_colors.items()]
-        plt.legend(handles=handles, loc='upper center', bbox_to_anchor=(0.5, 1.15),
-                 fancybox=True, shadow=True, ncol=min(5, len(speakers)))
-        
-        # Set axis limits and labels
-        plt.xlim(0, duration)
-        plt.ylim(0, 1)
-        plt.xlabel('Time (seconds)')
-        plt.yticks([])  # Hide y-axis ticks
-        
-        # Add time markers
-        time_interval = max(int(duration / 10), 1)  # At least every 1 second
-        time_markers = range(0, int(duration) + 1, time_interval)
-        plt.xticks(time_markers)
+        image = Image.new("RGB", (width, height), "white")
+        draw = ImageDraw.Draw(image)
+        font = ImageFont.load_default()
         
-        # Add grid
-        plt.grid(axis='x', linestyle='--', alpha=0.3)
+        # Get unique speakers and the color of each segment's speaker
+        speakers = sorted({s["speaker"] for s in segments})
+        speaker_index = {speaker: i for i, speaker in enumerate(speakers)}
+        colors = [_blend_on_white(self.speaker_colors[i % len(self.speaker_colors)])
+                  for i in range(len(speakers))]
+        segment_colors = [colors[speaker_index[s["speaker"]]] for s in segments]
         
-        # Convert plot to base64 image
+        # Add time markers with a light grid
+        time_interval = max(int(duration / 10), 1)  # At least every 1 second
+        for marker in range(0, int(duration) + 1, time_interval):
+            x = min(int(marker * scale), width - 1)
+            draw.line([x, bar_top, x, bar_bottom], fill="#E0E0E0")
+            draw.text((x, bar_bottom + 5), str(marker), fill="black", font=font, anchor="mt")
+        draw.text((width // 2, height - 5), "Time (seconds)", fill="black", font=font, anchor="mb")
+        
+        # Compute every segment's pixel extent at once
+        starts = np.array([s["start"] for s in segments], dtype=float)
+        ends = np.array([s["end"] for s in segments], dtype=float)
+        x0s = (starts * scale).astype(int)
+        x1s = np.maximum((ends * scale).astype(int), x0s + 1)
+        labelled = (ends - starts) > duration / 30  # Only label longer segments
+        
+        # Draw segments as colored blocks
+        for segment, color, x0, x1, label in zip(segments, segment_colors, x0s.tolist(), x1s.tolist(), labelled.tolist()):
+            draw.rectangle([x0, bar_top, x1, bar_bottom], fill=color)
+            if label:
+                draw.text(((x0 + x1) // 2, (bar_top + bar_bottom) // 2), segment["speaker"],
+                          fill="black", font=font, anchor="mm")
+        
+        # Add legend across the top
+        legend_x = 10
+        for speaker, color in zip(speakers, colors):
+            draw.rectangle([legend_x, 12, legend_x + 16, 28], fill=color)
+            draw.text((legend_x + 22, 20), speaker, fill="black", font=font, anchor="lm")
+            legend_x += 32 + int(draw.textlength(speaker, font=font))
+        
+        # Encode the PNG as base64
         buffer = io.BytesIO()
-        plt.tight_layout()
-        plt.savefig(buffer, format='png', dpi=100)
-        plt.close(fig)
-        buffer.seek(0)
-        
-        # Encode to base64
+        image.save(buffer, format="PNG")
         img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
         return img_str
     
@@ -580,23 +869,16 @@ class SpeakerDiarization:
         if not segments:
             return {}
             
-        # Get unique speakers
-        speakers = sorted(list(set(s["speaker"] for s in segments)))
-        
-        # Calculate speaking time for each speaker
-        speaker_times = {speaker: 0.0 for speaker in speakers}
-        for segment in segments:
-            speaker = segment["speaker"]
-            speaker_times[speaker] += segment["duration"]
+        # Get unique speakers, speaking time and segment counts in one pass
+        aggregate = self._aggregate(segments)
+        speakers = sorted(aggregate["speakers"])
+        speaker_times = aggregate["times"]
+        segment_counts = aggregate["counts"]
         
         # Calculate percentages
         speaker_percentages = {speaker: round((time / duration) * 100, 1) 
                              for speaker, time in speaker_times.items()}
         
-        # Count segments per speaker
-        segment_counts = {speaker: sum(1 for s in segments if s["speaker"] == speaker)
-                         for speaker in speakers}
-        
         # Calculate average segment duration
         avg_durations = {speaker: round(speaker_times[speaker] / segment_counts[speaker], 2)
                         if segment_counts[speaker] > 0 else 0
@@ -613,13 +895,10 @@ class SpeakerDiarization:
         secondary_speakers = sorted_speakers[1:] if len(sorted_speakers) > 1 else []
         
         # Count speaker transitions (turn-taking)
-        transitions = 0
-        for i in range(1, len(segments)):
-            if segments[i]["speaker"] != segments[i-1]["speaker"]:
-                transitions += 1
+        transitions = aggregate["transitions"]
         
         # Calculate speaker colors for visualization
-        speaker_colors = {speakers[i]: to_hex(self.speaker_colors[i % len(self.speaker_colors)])
+        speaker_colors = {speakers[i]: self.speaker_colors[i % len(self.speaker_colors)].lower()
                          for i in range(len(speakers))}
         
         # Assemble statistics
@@ -0,0 +1,264 @@
+"""
+Dedicated GPU worker process for model inference.
+Whisper and pyannote run in a single long-lived process so only one copy of
+each model (and one CUDA context) exists, no matter how many API threads or
+jobs are submitting work.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Dict, List, Optional, Union
+from pathlib import Path
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Message sent by the worker once its models are constructed
+_READY = "__ready__"
+
+# Seconds between checks that the worker process is still alive
+_LIVENESS_INTERVAL = 1.0
+
+
+def _worker_main(request_queue, result_queue, whisper_model_size: str, auth_token: Optional[str]):
+    """
+    Entry point of the worker process: build the models once, then serve
+    (request_id, stage, args) requests until a None sentinel arrives.
+    """
+    try:
+        from transcription import WhisperTranscriber
+        from diarization import SpeakerDiarization
+    except ImportError:
+        from backend.transcription import WhisperTranscriber
+        from backend.diarization import SpeakerDiarization
+
+    transcriber = WhisperTranscriber(model_size=whisper_model_size)
+    diarizer = None
+    result_queue.put((_READY, {"mock_mode": transcriber._mock_mode}, None))
+
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+
+        request_id, stage, args = request
+        try:
+            if stage == "transcribe_batch":
+                # Per-file failures come back as exceptions; send them as plain
+                # RuntimeErrors so they always pickle across the queue
+                result = [
+                    RuntimeError(str(r)) if isinstance(r, Exception) else r
+                    for r in transcriber.transcribe_batch(*args)
+                ]
+            elif stage == "diarize":
+                # The diarization pipeline is loaded on first use
+                if diarizer is None:
+                    diarizer = SpeakerDiarization(use_auth_token=auth_token)
+                result = diarizer.diarize(*args)
+            else:
+                raise ValueError(f"Unknown stage: {stage}")
+            result_queue.put((request_id, result, None))
+        except Exception as e:
+            result_queue.put((request_id, None, f"{type(e).__name__}: {str(e)}"))
+
+
+class GPUWorker:
+    """
+    Client for the GPU worker process. Exposes the same transcribe_batch and
+    diarize methods as WhisperTranscriber and SpeakerDiarization, blocking
+    until the worker returns a result.
+    """
+
+    def __init__(self, whisper_model_size: str = "base", auth_token: Optional[str] = None,
+                 request_timeout: Optional[float] = 3600.0):
+        """
+        Initialize the GPU worker client.
+
+        Args:
+            whisper_model_size: Size of the Whisper model to load in the worker
+            auth_token: Hugging Face access token for the diarization pipeline
+            request_timeout: Seconds to wait for the result of a request
+                (None waits indefinitely)
+        """
+        self.whisper_model_size = whisper_model_size
+        self.auth_token = auth_token
+        self.request_timeout = request_timeout
+        self._mock_mode = False
+
+        # Spawn rather than fork so CUDA is only ever initialized in the worker
+        self._context = multiprocessing.get_context("spawn")
+        self._request_queue = None
+        self._result_queue = None
+        self._process = None
+        self._dispatcher = None
+
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._ready = threading.Event()
+
+    def start(self, timeout: float = 120.0):
+        """
+        Start the worker process and wait until its models are constructed.
+
+        Args:
+            timeout: Seconds to wait for the worker to become ready
+        """
+        self._request_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(self._request_queue, self._result_queue, self.whisper_model_size, self.auth_token),
+            daemon=True
+        )
+        self._process.start()
+
+        self._dispatcher = threading.Thread(target=self._dispatch_results, daemon=True)
+        self._dispatcher.start()
+
+        # Poll the process while waiting, so a worker that died loading its
+        # models fails the start right away instead of after the full timeout
+        deadline = time.monotonic() + timeout
+        while not self._ready.wait(_LIVENESS_INTERVAL):
+            if not self._process.is_alive():
+                self.stop()
+                raise RuntimeError(f"GPU worker exited during startup (exit code {self._process.exitcode})")
+            if time.monotonic() >= deadline:
+                self.stop()
+                raise RuntimeError(f"GPU worker did not start within {timeout} seconds")
+        logger.info(f"GPU worker started (pid {self._process.pid})")
+
+    def stop(self):
+        """
+        Stop the worker process and fail any requests still waiting on it.
+        """
+        if self._process is not None and self._process.is_alive():
+            self._request_queue.put(None)
+            self._process.join(timeout=10)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self._result_queue is not None:
+            # Wake the dispatcher so it exits
+            self._result_queue.put(None)
+
+        self._fail_pending(RuntimeError("GPU worker stopped"))
+
+    def _fail_pending(self, error: Exception):
+        """
+        Fail every request still waiting on the worker.
+
+        Args:
+            error: Exception set on the waiting futures
+        """
+        with self._pending_lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future in pending:
+            future.set_exception(error)
+
+    def _dispatch_results(self):
+        """
+        Route results from the worker to the futures waiting on them, and
+        fail the waiting requests if the worker process dies.
+        """
+        while True:
+            try:
+                message = self._result_queue.get(timeout=_LIVENESS_INTERVAL)
+            except queue.Empty:
+                # A worker killed by a crash or OOM never answers its requests
+                if not self._process.is_alive():
+                    error = f"GPU worker exited unexpectedly (exit code {self._process.exitcode})"
+                    logger.error(error)
+                    self._fail_pending(RuntimeError(error))
+                    break
+                continue
+            if message is None:
+                break
+
+            request_id, result, error = message
+            if request_id == _READY:
+                self._mock_mode = result["mock_mode"]
+                self._ready.set()
+                continue
+
+            with self._pending_lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(result)
+
+    def submit(self, stage: str, *args) -> Future:
+        """
+        Queue a request for the worker.
+
+        Args:
+            stage: Name of the stage to run ("transcribe_batch" or "diarize")
+            *args: Arguments for the stage
+
+        Returns:
+            Future resolved with the stage result
+        """
+        if self._process is None or not self._process.is_alive():
+            raise RuntimeError("GPU worker is not running")
+
+        future = Future()
+        request_id = next(self._request_ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+        self._request_queue.put((request_id, stage, args))
+        return future
+
+    def _wait(self, stage: str, *args) -> Any:
+        """
+        Submit a request and wait up to request_timeout for its result.
+
+        Args:
+            stage: Name of the stage to run
+            *args: Arguments for the stage
+
+        Returns:
+            The stage result
+        """
+        future = self.submit(stage, *args)
+        try:
+            return future.result(timeout=self.request_timeout)
+        except TimeoutError:
+            # Stop tracking the request; a late result is dropped by the dispatcher
+            with self._pending_lock:
+                for request_id, pending in list(self._pending.items()):
+                    if pending is future:
+                        del self._pending[request_id]
+            raise RuntimeError(f"GPU worker did not finish {stage} within {self.request_timeout} seconds")
+
+    def transcribe_batch(self, file_paths: List[Union[str, Path]]) -> List[Union[Dict, Exception]]:
+        """
+        Transcribe several files in the worker process.
+
+        Args:
+            file_paths: Paths to the files to transcribe
+
+        Returns:
+            List with one transcript dictionary or exception per input path
+        """
+        return self._wait("transcribe_batch", [str(p) for p in file_paths])
+
+    def diarize(self, audio_file: Union[str, Path], *args) -> Any:
+        """
+        Run speaker diarization in the worker process.
+
+        Args:
+            audio_file: Path to the audio file
+            *args: Remaining SpeakerDiarization.diarize arguments
+
+        Returns:
+            Diarization result
+        """
+        return self._wait("diarize", str(audio_file), *args)
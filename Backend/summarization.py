@@ -1,9 +1,16 @@
 ﻿import logging
 import nltk
-from typing import List, Optional
+from typing import List, Optional, Union
+from array import array
 import torch
 import re
 import os
+import shutil
+import hashlib
+import threading
+import contextlib
+from collections import OrderedDict
+from pathlib import Path
 
 # Set up logging
 logging.basicConfig(level=logging.INFO,
@@ -28,11 +35,68 @@ except LookupError:
 # Check for transformers and sumy
 try:
     from transformers import T5ForConditionalGeneration, T5Tokenizer
+    try:
+        # The Rust tokenizer is much faster; it needs the tokenizers package
+        from transformers import T5TokenizerFast
+    except ImportError:
+        T5TokenizerFast = None
     TRANSFORMERS_AVAILABLE = True
 except ImportError:
     logger.warning("Transformers not available; abstractive summarization will be limited")
     TRANSFORMERS_AVAILABLE = False
 
+# ONNX Runtime inference for the abstractive model is optional (CPU only)
+try:
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Run the abstractive model as an INT8-quantized ONNX export when on CPU
+SUMMARIZER_ONNX = os.environ.get("SUMMARIZER_ONNX", "false").lower() == "true"
+
+# Where the quantized ONNX exports are kept between runs
+SUMMARIZER_ONNX_DIR = Path(os.environ.get(
+    "SUMMARIZER_ONNX_DIR",
+    Path(os.environ.get("MODEL_CACHE_DIR") or Path.home() / ".cache") / "onnx"
+))
+
+# Generated summaries kept in memory, keyed by the input text and generation
+# settings; SUMMARY_CACHE_DIR additionally keeps them on disk across restarts
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", 1024))
+SUMMARY_CACHE_DIR = os.environ.get("SUMMARY_CACHE_DIR")
+
+# Chunks of a long text summarized together in one generate() call
+SUMMARY_BATCH_SIZE = int(os.environ.get("SUMMARY_BATCH_SIZE", 8))
+
+# Long texts are tokenized once and summarized as overlapping windows of
+# token ids; the overlap gives each window context across its boundary
+SUMMARY_WINDOW_TOKENS = 1000
+SUMMARY_WINDOW_OVERLAP = 100
+
+# Windows shorter than this many tokens are kept as text rather than summarized
+SUMMARY_MIN_WINDOW_TOKENS = 40
+
+# Beam width for generation; 1 is greedy decoding, which runs the decoder
+# once per step instead of once per beam
+SUMMARY_NUM_BEAMS = max(1, int(os.environ.get("SUMMARY_NUM_BEAMS", 1)))
+
+# Compile the PyTorch model's forward pass with torch.compile (opt-in:
+# compilation adds start-up time, spent in preload() when it is called)
+SUMMARIZER_COMPILE = os.environ.get("SUMMARIZER_COMPILE", "false").lower() == "true"
+
+# Generate under reduced-precision autocast on GPU; set to false to run the
+# FP32 weights as they are
+ENABLE_AMP = os.environ.get("ENABLE_AMP", "true").lower() == "true"
+
+# Intra-op threads for PyTorch CPU inference, set when the model loads; 0
+# keeps PyTorch's default. The setting is process-wide.
+SUMMARIZER_CPU_THREADS = int(os.environ.get("SUMMARIZER_CPU_THREADS", 0))
+
+# generate() settings that only apply to beam search
+BEAM_SEARCH_KWARGS = ("early_stopping", "length_penalty")
+
 try:
     from sumy.parsers.plaintext import PlaintextParser
     from sumy.nlp.tokenizers import Tokenizer
@@ -42,6 +106,16 @@ except ImportError:
     logger.warning("Sumy not available; extractive summarization will be limited")
     SUMY_AVAILABLE = False
 
+# Speaker labels with timestamps like "Speaker 1 [00:01 - 00:05]: ", and
+# other timestamp formats like [00:00:00], removed together in one pass
+TRANSCRIPT_MARKUP_PATTERN = re.compile(
+    r'Speaker \d+\s+\[\d+:\d+\s+-\s+\d+:\d+\]:\s+'
+    r'|\[\d+:\d+(?::\d+)?\]'
+)
+
+# Whitespace following the end of a sentence
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
 # Common utility function for transcript cleaning
 def clean_transcript(text: str) -> str:
     """
@@ -53,13 +127,8 @@ def clean_transcript(text: str) -> str:
     Returns:
         Cleaned text
     """
-    # Remove speaker labels and timestamps like "Speaker 1 [00:01 - 00:05]: "
-    cleaned = re.sub(r'Speaker \d+\s+\[\d+:\d+\s+-\s+\d+:\d+\]:\s+', '', text)
-    
-    # Remove any other timestamp formats like [00:00:00]
-    cleaned = re.sub(r'\[\d+:\d+(?::\d+)?\]', '', cleaned)
-    
-    return cleaned
+    # Remove speaker labels and timestamps in a single scan
+    return TRANSCRIPT_MARKUP_PATTERN.sub('', text)
 
 class ExtractiveSummarizer:
     """
@@ -148,7 +217,7 @@ class ExtractiveSummarizer:
             cleaned_text = clean_transcript(text)
             
             # Split into sentences using regex to avoid NLTK dependency
-            sentences = re.split(r'(?<=[.!?])\s+', cleaned_text)
+            sentences = SENTENCE_SPLIT_PATTERN.split(cleaned_text)
             
             # Get first N sentences (up to 20% of the original text or at least 3 sentences)
             num_sentences = max(3, min(10, int(len(sentences) * 0.2)))
@@ -187,12 +256,29 @@ class AbstractiveSummarizer:
         self._model = None
         self._tokenizer = None
         self._model_available = TRANSFORMERS_AVAILABLE
+        self._compiled = False
+        
+        # Resolve the device once rather than on every generate call
+        self._use_gpu = torch.cuda.is_available() and os.environ.get("ENABLE_GPU", "true").lower() == "true"
+        
+        # Reduced precision used for GPU generation. T5 overflows in FP16
+        # without care, so BF16 is preferred where the GPU supports it.
+        self._autocast_dtype = None
+        if self._use_gpu and ENABLE_AMP:
+            self._autocast_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        
+        # Generated summaries by content hash (see _generate)
+        self._summary_cache = OrderedDict()
+        self._summary_cache_lock = threading.Lock()
+        self._summary_cache_dir = Path(SUMMARY_CACHE_DIR) if SUMMARY_CACHE_DIR else None
+        if self._summary_cache_dir:
+            self._summary_cache_dir.mkdir(parents=True, exist_ok=True)
         
         # Try to initialize the model
         if self._model_available:
             try:
-                # Just load the tokenizer to see if the model is available
-                _ = T5Tokenizer.from_pretrained(self.model_name)
+                # Load the tokenizer, which also checks the model is available
+                _ = self.tokenizer
             except Exception as e:
                 logger.warning(f"Failed to initialize model: {e}")
                 self._model_available = False
@@ -202,15 +288,25 @@ class AbstractiveSummarizer:
         """Lazy load the T5 model"""
         if self._model is None and self._model_available:
             try:
+                if SUMMARIZER_ONNX and ONNX_AVAILABLE and not self._use_gpu:
+                    try:
+                        self._model = self._load_onnx_model()
+                        return self._model
+                    except Exception as e:
+                        logger.warning(f"Could not load ONNX model, using PyTorch: {e}")
+                
                 logger.info(f"Loading {self.model_name} model...")
                 self._model = T5ForConditionalGeneration.from_pretrained(self.model_name)
                 
                 # Use GPU if available
-                if torch.cuda.is_available() and os.environ.get("ENABLE_GPU", "true").lower() == "true":
+                if self._use_gpu:
+                    # Weights stay in FP32; generation runs under autocast
                     self._model = self._model.to("cuda").eval()
-                    # For faster inference, use half precision
-                    if self.model_name != "t5-small":  # Skip for small model as it might hurt quality
-                        self._model = self._model.half()
+                elif SUMMARIZER_CPU_THREADS > 0:
+                    torch.set_num_threads(SUMMARIZER_CPU_THREADS)
+                
+                if SUMMARIZER_COMPILE:
+                    self._compile_model(self._model)
                     
                 logger.info(f"{self.model_name} model loaded successfully.")
             except Exception as e:
@@ -219,13 +315,73 @@ class AbstractiveSummarizer:
                 
         return self._model
     
+    def _compile_model(self, model):
+        """
+        Replace the model's forward with a torch.compile'd version, fusing
+        the many small per-step decoder ops. Only forward is compiled, so
+        generate() keeps running its usual decoding loop around it. Uses
+        CUDA graphs ("reduce-overhead") on GPU.
+        
+        Args:
+            model: The PyTorch T5 model.
+        """
+        if not hasattr(torch, "compile"):
+            return
+        
+        mode = "reduce-overhead" if self._use_gpu else "default"
+        try:
+            model.forward = torch.compile(model.forward, mode=mode, dynamic=True)
+            self._compiled = True
+            logger.info(f"Compiled {self.model_name} forward pass ({mode})")
+        except Exception as e:
+            logger.warning(f"Could not compile {self.model_name}, using eager mode: {e}")
+    
+    def _load_onnx_model(self):
+        """
+        Load the model as an INT8-quantized ONNX Runtime model, exporting
+        and quantizing it on first use. The quantized files are kept on disk
+        so later starts load them directly.
+        
+        Returns:
+            ORTModelForSeq2SeqLM with the same generate() interface
+        """
+        quantized_dir = SUMMARIZER_ONNX_DIR / f"{self.model_name.replace('/', '--')}-int8"
+        
+        if not any(quantized_dir.glob("*_quantized.onnx")):
+            logger.info(f"Exporting {self.model_name} to ONNX and quantizing to INT8...")
+            export_dir = quantized_dir.with_name(quantized_dir.name + "-export")
+            ORTModelForSeq2SeqLM.from_pretrained(self.model_name, export=True).save_pretrained(export_dir)
+            
+            # Dynamic quantization: INT8 weights, activations quantized on the fly
+            config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            for onnx_file in export_dir.glob("*.onnx"):
+                quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=onnx_file.name)
+                quantizer.quantize(save_dir=quantized_dir, quantization_config=config)
+            
+            # Keep the model and generation configs next to the quantized files
+            for config_file in export_dir.glob("*.json"):
+                if not (quantized_dir / config_file.name).exists():
+                    shutil.copy(config_file, quantized_dir)
+        
+        file_names = {
+            "encoder_file_name": "encoder_model_quantized.onnx",
+            "decoder_file_name": "decoder_model_quantized.onnx",
+            "decoder_with_past_file_name": "decoder_with_past_model_quantized.onnx",
+        }
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            quantized_dir,
+            **{key: name for key, name in file_names.items() if (quantized_dir / name).exists()}
+        )
+        logger.info(f"{self.model_name} ONNX INT8 model loaded successfully.")
+        return model
+    
     @property
     def tokenizer(self):
         """Lazy load the T5 tokenizer"""
         if self._tokenizer is None and self._model_available:
             try:
                 logger.info(f"Loading {self.model_name} tokenizer...")
-                self._tokenizer = T5Tokenizer.from_pretrained(self.model_name)
+                self._tokenizer = (T5TokenizerFast or T5Tokenizer).from_pretrained(self.model_name)
                 logger.info(f"{self.model_name} tokenizer loaded successfully.")
             except Exception as e:
                 logger.error(f"Error loading tokenizer: {str(e)}")
@@ -233,6 +389,25 @@ class AbstractiveSummarizer:
                 
         return self._tokenizer
     
+    def preload(self):
+        """
+        Load the model and tokenizer now rather than on the first summary.
+        """
+        _ = self.tokenizer
+        _ = self.model
+        
+        # Compilation happens on the first forward pass; run a short
+        # generation now so the first real summary doesn't wait for it
+        if self._compiled:
+            try:
+                inputs = self.tokenizer(["summarize: warm up"], return_tensors="pt")
+                if self._use_gpu:
+                    inputs = inputs.to("cuda")
+                with torch.no_grad(), self._autocast():
+                    self.model.generate(**inputs, max_length=8, num_beams=SUMMARY_NUM_BEAMS)
+            except Exception as e:
+                logger.warning(f"Summarizer warm-up failed: {e}")
+    
     def summarize(self, text: str, max_input_length: int = 1024) -> str:
         """
         Generate an abstractive summary of the text.
@@ -253,50 +428,32 @@ class AbstractiveSummarizer:
             # Clean the text
             cleaned_text = clean_transcript(text)
             
+            word_count = len(cleaned_text.split())
+            
             # For very short texts, return a simple response
-            if len(cleaned_text.split()) < 20:
+            if word_count < 20:
                 return {"summary": "The content is too short for a meaningful summary."}
             
             # Check if text is longer than max_input_length
-            if len(cleaned_text.split()) > max_input_length:
-                logger.info(f"Text too long ({len(cleaned_text.split())} words), using chunking approach")
+            if word_count > max_input_length:
+                logger.info(f"Text too long ({word_count} words), using chunking approach")
                 return self._summarize_long_text(cleaned_text)
             
             # If text is very long, use optimized long text processing
-            if len(cleaned_text.split()) > 600:
+            if word_count > 600:
                 return self._summarize_long_text(cleaned_text)
             
-            # Prepare input text
-            input_text = f"summarize: {cleaned_text}"
-            
-            # Tokenize input
-            input_ids = self.tokenizer.encode(
-                input_text, 
-                return_tensors="pt", 
-                max_length=max_input_length, 
-                truncation=True
+            # Generate with an optimized inference configuration
+            summary = self._generate(
+                cleaned_text,
+                max_input_length=max_input_length,
+                max_length=self.max_length,
+                num_beams=SUMMARY_NUM_BEAMS,
+                early_stopping=True,
+                length_penalty=0.8,  # Slightly prefer shorter output
+                no_repeat_ngram_size=2
             )
             
-            # Move to GPU if available
-            if torch.cuda.is_available() and os.environ.get("ENABLE_GPU", "true").lower() == "true":
-                input_ids = input_ids.to("cuda")
-            
-            # Use optimized inference configuration
-            with torch.no_grad():
-                # Set up generation parameters for faster inference
-                output = self.model.generate(
-                    input_ids,
-                    max_length=self.max_length,
-                    num_beams=2,  # Lower beam search width for faster processing
-                    early_stopping=True,
-                    length_penalty=0.8,  # Slightly prefer shorter output
-                    no_repeat_ngram_size=2,
-                    temperature=0.7  # Slightly increase randomness
-                )
-            
-            # Decode the output
-            summary = self.tokenizer.decode(output[0], skip_special_tokens=True)
-            
             # If summary is empty or too short, use fallback
             if not summary.strip() or len(summary.strip()) < 10:
                 return self._fallback_summarize(text)
@@ -308,26 +465,129 @@ class AbstractiveSummarizer:
             logger.error(f"Error during abstractive summarization: {str(e)}")
             return self._fallback_summarize(text)
     
-    def _fallback_summarize(self, text: str) -> str:
+    def _autocast(self):
+        """
+        Reduced-precision autocast for GPU generation. On CPU, or with
+        ENABLE_AMP off, no autocast context is entered, since a disabled CUDA
+        one still warns on CPU.
+        """
+        if self._autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast("cuda", dtype=self._autocast_dtype)
+    
+    def _generate(self, text: str, max_input_length: int, **generate_kwargs) -> str:
+        """
+        Run the model on a single text; see _generate_batch.
+        """
+        return self._generate_batch([text], max_input_length, **generate_kwargs)[0]
+    
+    def _generate_batch(self, texts: List[Union[str, List[int]]], max_input_length: int, **generate_kwargs) -> List[str]:
+        """
+        Run the model on several inputs in padded batches, reusing summaries
+        generated earlier for the same input, model and settings.
+        
+        Args:
+            texts: Cleaned texts to summarize, or token ids that already
+                include the "summarize: " prefix (all of the same kind)
+            max_input_length: Maximum number of input tokens
+            **generate_kwargs: Arguments for model.generate
+            
+        Returns:
+            Generated summary text for each input, in order
+        """
+        # Greedy decoding ignores the beam search settings
+        if generate_kwargs.get("num_beams", 1) == 1:
+            generate_kwargs = {k: v for k, v in generate_kwargs.items() if k not in BEAM_SEARCH_KWARGS}
+        
+        settings = repr((self.model_name, max_input_length, sorted(generate_kwargs.items())))
+        keys = []
+        for text in texts:
+            digest = hashlib.blake2b(settings.encode(), digest_size=16)
+            if isinstance(text, str):
+                digest.update(b"\0" + text.encode())
+            else:
+                digest.update(b"\1" + array("l", text).tobytes())
+            keys.append(digest.hexdigest())
+        
+        # Look up earlier results in memory, then on disk
+        summaries = [None] * len(texts)
+        with self._summary_cache_lock:
+            for i, key in enumerate(keys):
+                if key in self._summary_cache:
+                    self._summary_cache.move_to_end(key)
+                    summaries[i] = self._summary_cache[key]
+        if self._summary_cache_dir:
+            for i, key in enumerate(keys):
+                cache_path = self._summary_cache_dir / f"{key}.txt"
+                if summaries[i] is None and cache_path.exists():
+                    summaries[i] = cache_path.read_text(encoding="utf-8")
+        
+        # Generate the rest, one forward pass per batch
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        for batch_start in range(0, len(missing), SUMMARY_BATCH_SIZE):
+            batch = missing[batch_start:batch_start + SUMMARY_BATCH_SIZE]
+            
+            # Tokenize, padding the batch to its longest input
+            if isinstance(texts[batch[0]], str):
+                inputs = self.tokenizer(
+                    [f"summarize: {texts[i]}" for i in batch],
+                    return_tensors="pt",
+                    max_length=max_input_length,
+                    truncation=True,
+                    padding=True
+                )
+            else:
+                inputs = self.tokenizer.pad(
+                    {"input_ids": [texts[i][:max_input_length] for i in batch]},
+                    return_tensors="pt"
+                )
+            
+            # Move to GPU if available
+            if self._use_gpu:
+                inputs = inputs.to("cuda")
+            
+            with torch.no_grad(), self._autocast():
+                output = self.model.generate(
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    **generate_kwargs
+                )
+            
+            # Decode
+            for i, summary in zip(batch, self.tokenizer.batch_decode(output, skip_special_tokens=True)):
+                summaries[i] = summary
+                if self._summary_cache_dir:
+                    (self._summary_cache_dir / f"{keys[i]}.txt").write_text(summary, encoding="utf-8")
+        
+        with self._summary_cache_lock:
+            for key, summary in zip(keys, summaries):
+                self._summary_cache[key] = summary
+                self._summary_cache.move_to_end(key)
+            while len(self._summary_cache) > SUMMARY_CACHE_SIZE:
+                self._summary_cache.popitem(last=False)
+        return summaries
+    
+    def _fallback_summarize(self, text: str, cleaned: bool = False) -> str:
         """
         Simple fallback summarization by extracting first few sentences.
         
         Args:
             text: Input text
+            cleaned: Whether the text was already cleaned with clean_transcript
             
         Returns:
             Simple summary dictionary
         """
         try:
             # Clean the text
-            cleaned_text = clean_transcript(text)
+            cleaned_text = text if cleaned else clean_transcript(text)
             
             # For very short texts, return a simple response
             if len(cleaned_text.split()) < 20:
                 return {"summary": "The content is too short for a meaningful summary."}
             
             # Split into sentences using regex
-            sentences = re.split(r'(?<=[.!?])\s+', cleaned_text)
+            sentences = SENTENCE_SPLIT_PATTERN.split(cleaned_text)
             
             # If only a few sentences, just use them
             if len(sentences) <= 4:
@@ -353,65 +613,34 @@ class AbstractiveSummarizer:
     
     def _summarize_long_text(self, text: str) -> dict:
         """
-        Summarize a long text by breaking it into chunks.
+        Summarize a long text as overlapping windows of its token ids. The
+        text is tokenized once; each window is a slice of the ids with the
+        "summarize: " prefix ids in front, so chunks are never re-tokenized.
         
         Args:
-            text: Long input text
+            text: Long input text, already cleaned with clean_transcript
             
         Returns:
             Summary dictionary of the long text
         """
         try:
-            # Clean the text
-            cleaned_text = clean_transcript(text)
-            
-            # Split into sentences
-            sentences = re.split(r'(?<=[.!?])\s+', cleaned_text)
+            prefix_ids = self.tokenizer("summarize: ", add_special_tokens=False)["input_ids"]
+            token_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+            eos_ids = [self.tokenizer.eos_token_id]
             
-            if len(sentences) <= 10:
-                # If not many sentences, use regular summarization
-                return self._summarize_chunk(cleaned_text)
+            # Each window holds the prefix, a slice of the text and the EOS token
+            body = SUMMARY_WINDOW_TOKENS - len(prefix_ids) - len(eos_ids)
+            stride = body - SUMMARY_WINDOW_OVERLAP
+            windows = [
+                prefix_ids + token_ids[start:start + body] + eos_ids
+                for start in range(0, max(len(token_ids) - SUMMARY_WINDOW_OVERLAP, 1), stride)
+            ]
             
-            # Determine chunk size: try to create 3-5 chunks
-            chunks_target = min(5, max(3, len(sentences) // 200))
-            chunk_size = max(10, len(sentences) // chunks_target)
+            logger.info(f"Split text into {len(windows)} windows of up to {SUMMARY_WINDOW_TOKENS} tokens")
             
-            # Create chunks of sentences
-            chunks = []
-            for i in range(0, len(sentences), chunk_size):
-                chunk = " ".join(sentences[i:i+chunk_size])
-                if chunk.strip():  # Only add non-empty chunks
-                    chunks.append(chunk)
-            
-            logger.info(f"Split text into {len(chunks)} chunks for processing")
-            
-            # Process each chunk with max worker threads for better parallelism
-            import concurrent.futures
-            
-            # Calculate optimal workers based on chunks and available CPUs
-            max_workers = min(len(chunks), os.cpu_count() or 4)
-            
-            chunk_summaries = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_chunk = {executor.submit(self._summarize_chunk, chunk): i for i, chunk in enumerate(chunks)}
-                
-                for future in concurrent.futures.as_completed(future_to_chunk):
-                    chunk_idx = future_to_chunk[future]
-                    try:
-                        summary_dict = future.result()
-                        summary = summary_dict.get("summary", "")
-                        chunk_summaries.append((chunk_idx, summary))
-                    except Exception as e:
-                        logger.error(f"Error summarizing chunk {chunk_idx}: {e}")
-                        # Use a fallback for failed chunks
-                        chunk_text = chunks[chunk_idx]
-                        sentences = re.split(r'(?<=[.!?])\s+', chunk_text)
-                        fallback = " ".join(sentences[:2]) + " [...] " + " ".join(sentences[-2:])
-                        chunk_summaries.append((chunk_idx, fallback))
-            
-            # Sort by original order and join
-            chunk_summaries.sort()
-            intermediate_summary = " ".join([summary for _, summary in chunk_summaries])
+            # Summarize all windows together in batched forward passes
+            chunk_summaries = self._summarize_windows(windows, len(prefix_ids))
+            intermediate_summary = " ".join(chunk_summaries)
             
             # If the intermediate summary is still long, summarize it again
             if len(intermediate_summary.split()) > 500:
@@ -423,64 +652,114 @@ class AbstractiveSummarizer:
                 
         except Exception as e:
             logger.error(f"Long text summarization failed: {str(e)}")
-            return self._fallback_summarize(text)
+            return self._fallback_summarize(text, cleaned=True)
     
-    def _summarize_chunk(self, chunk: str) -> dict:
+    def _summarize_chunks(self, chunks: List[str]) -> List[str]:
         """
-        Summarize a single chunk of text.
+        Summarize several chunks of text with batched generation.
         
         Args:
-            chunk: Text chunk to summarize
+            chunks: Text chunks to summarize
             
         Returns:
-            Dictionary containing summary of the chunk
+            Summary of each chunk, in order
         """
+        # Chunks too short to summarize are kept as they are
+        summaries = [chunk if len(chunk.split()) < 30 else None for chunk in chunks]
+        pending = [i for i, summary in enumerate(summaries) if summary is None]
+        if not pending:
+            return summaries
+        
         try:
-            # Check if chunk is too short
-            if len(chunk.split()) < 30:
-                return {"summary": chunk}
-                
-            # Prepare input text
-            input_text = f"summarize: {chunk}"
-            
-            # Tokenize
-            input_ids = self.tokenizer.encode(
-                input_text, 
-                return_tensors="pt", 
-                max_length=1024, 
-                truncation=True
+            generated = self._generate_batch(
+                [chunks[i] for i in pending],
+                max_input_length=1024,
+                max_length=150,
+                num_beams=SUMMARY_NUM_BEAMS,
+                early_stopping=True,
+                no_repeat_ngram_size=2
             )
+        except Exception as e:
+            logger.error(f"Error summarizing chunks: {str(e)}")
+            generated = [None] * len(pending)
+        
+        for i, summary in zip(pending, generated):
+            summaries[i] = self._chunk_summary_or_excerpt(chunks[i], summary)
+        return summaries
+    
+    def _summarize_windows(self, windows: List[List[int]], prefix_length: int) -> List[str]:
+        """
+        Summarize token id windows with batched generation. Windows are only
+        decoded back to text when they are kept as excerpts.
+        
+        Args:
+            windows: Token ids of each window, starting with the prefix ids
+            prefix_length: Number of "summarize: " prefix ids in each window
             
-            # Move to GPU if available
-            if torch.cuda.is_available() and os.environ.get("ENABLE_GPU", "true").lower() == "true":
-                input_ids = input_ids.to("cuda")
-            
-            # Generate summary
-            with torch.no_grad():
-                output = self.model.generate(
-                    input_ids,
-                    max_length=150,
-                    num_beams=2,
-                    early_stopping=True,
-                    no_repeat_ngram_size=2
-                )
-            
-            # Decode
-            summary = self.tokenizer.decode(output[0], skip_special_tokens=True)
-            
-            # If summary is too short or empty, return original text
-            if not summary.strip() or len(summary.strip()) < 10:
-                return {"summary": chunk[:500] + " [...]"}
-                
-            return {"summary": summary}
-            
+        Returns:
+            Summary of each window, in order
+        """
+        def window_text(window):
+            return self.tokenizer.decode(window[prefix_length:], skip_special_tokens=True)
+        
+        # Windows too short to summarize are kept as they are
+        summaries = [
+            window_text(window) if len(window) - prefix_length < SUMMARY_MIN_WINDOW_TOKENS else None
+            for window in windows
+        ]
+        pending = [i for i, summary in enumerate(summaries) if summary is None]
+        if not pending:
+            return summaries
+        
+        try:
+            generated = self._generate_batch(
+                [windows[i] for i in pending],
+                max_input_length=SUMMARY_WINDOW_TOKENS,
+                max_length=150,
+                num_beams=SUMMARY_NUM_BEAMS,
+                early_stopping=True,
+                no_repeat_ngram_size=2
+            )
         except Exception as e:
-            logger.error(f"Error summarizing chunk: {str(e)}")
+            logger.error(f"Error summarizing windows: {str(e)}")
+            generated = [None] * len(pending)
+        
+        for i, summary in zip(pending, generated):
+            if summary is not None and len(summary.strip()) >= 10:
+                summaries[i] = summary
+            else:
+                summaries[i] = self._chunk_summary_or_excerpt(window_text(windows[i]), summary)
+        return summaries
+    
+    def _chunk_summary_or_excerpt(self, chunk: str, summary: Optional[str]) -> str:
+        """
+        Use a generated chunk summary, or an excerpt of the chunk when
+        generation failed or produced too little.
+        
+        Args:
+            chunk: Text of the chunk
+            summary: Generated summary, or None if generation failed
             
+        Returns:
+            Summary text for the chunk
+        """
+        if summary is None:
             # Fallback to first few and last few sentences
-            sentences = re.split(r'(?<=[.!?])\s+', chunk)
-            if len(sentences) <= 4:
-                return {"summary": chunk}
-                
-            fallback = " ".join(sentences[:2]) + " [...] " + " ".join(sentences[-2:])
-            return {"summary": fallback}
+            sentences = SENTENCE_SPLIT_PATTERN.split(chunk)
+            return chunk if len(sentences) <= 4 else " ".join(sentences[:2]) + " [...] " + " ".join(sentences[-2:])
+        if not summary.strip() or len(summary.strip()) < 10:
+            # If summary is too short or empty, use the original text
+            return chunk[:500] + " [...]"
+        return summary
+    
+    def _summarize_chunk(self, chunk: str) -> dict:
+        """
+        Summarize a single chunk of text.
+        
+        Args:
+            chunk: Text chunk to summarize
+            
+        Returns:
+            Dictionary containing summary of the chunk
+        """
+        return {"summary": self._summarize_chunks([chunk])[0]}
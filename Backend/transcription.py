@@ -139,8 +139,9 @@ class WhisperTranscriber:
                 ffmpeg
                 .input(str(file_path))
                 .output(str(temp_audio_path), acodec='libmp3lame', ac=1, ar='16k')
+                .global_args('-hide_banner', '-loglevel', 'error')
                 .overwrite_output()
-                .run(quiet=True, capture_stdout=True, capture_stderr=True)
+                .run(capture_stderr=True)
             )
             logger.info(f"Audio extracted to {temp_audio_path}")
             return temp_audio_path
@@ -221,7 +222,32 @@ class WhisperTranscriber:
                     logger.info(f"Cleaned up temporary audio file: {audio_path}")
                 except Exception as e:
                     logger.warning(f"Failed to clean up temp audio file {audio_path}: {str(e)}")
-    
+
+    def transcribe_batch(self, file_paths: List[Union[str, Path]]) -> List[Union[Dict, Exception]]:
+        """
+        Transcribe several files with a single loaded model.
+
+        Whisper decodes one file at a time, so the files are transcribed in
+        turn against the shared model rather than reloading it per file.
+        A failure on one file does not abort the rest of the batch.
+
+        Args:
+            file_paths: Paths to the files to transcribe
+
+        Returns:
+            List with one entry per input path: the transcript dictionary from
+            transcribe(), or the exception raised for that file
+        """
+        logger.info(f"Transcribing batch of {len(file_paths)} files")
+        results = []
+        for file_path in file_paths:
+            try:
+                results.append(self.transcribe(file_path))
+            except Exception as e:
+                results.append(e)
+
+        return results
+
     def transcribe_with_timestamps(self, file_path: Union[str, Path]) -> Dict:
         """
         Transcribe audio/video file to text with timestamps.
@@ -1,4 +1,5 @@
 ﻿import os
+import asyncio
 import logging
 import tempfile
 from pathlib import Path
@@ -14,6 +15,27 @@ logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# A video ID taken from any supported URL form, or a bare video ID
+VIDEO_ID_PATTERN = re.compile(
+    r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/|youtube\.com\/v\/|youtube\.com\/e\/|youtube\.com\/user\/.*\/.*\/|youtube\.com\/user\/.*\?v=|youtube\.com\/shorts\/|youtube\.com\/live\/|youtube\.com\/\?v=|youtube\.com\/watch\?.*v=)(?P<id>[^&\n?#]+)'
+    r'|^(?P<bare>[A-Za-z0-9_-]{11})$'
+)
+
+# Hosts accepted as YouTube, along with their subdomains
+YOUTUBE_DOMAINS = ("youtube.com", "youtu.be", "youtube-nocookie.com", "ytimg.com")
+YOUTUBE_DOMAIN_SUFFIXES = tuple(f".{domain}" for domain in YOUTUBE_DOMAINS)
+
+# Video metadata kept next to a download, so a repeat download can be skipped
+METADATA_FIELDS = ("title", "uploader", "view_count", "upload_date", "duration", "thumbnail", "description")
+METADATA_SUFFIX = ".info.json"
+
+# Leftovers of an unfinished yt-dlp download
+PARTIAL_SUFFIXES = (".part", ".ytdl", ".temp")
+
+# Byte ranges yt-dlp fetches in parallel, and the size of each range request
+CONCURRENT_FRAGMENTS = int(os.environ.get("YTDL_CONCURRENT_FRAGMENTS", 4))
+HTTP_CHUNK_SIZE = int(os.environ.get("YTDL_HTTP_CHUNK_SIZE", 10 * 1024 * 1024))  # 10 MiB
+
 class YouTubeDownloader:
     """
     YouTube downloader specifically for fetching podcast audio from YouTube.
@@ -76,8 +98,9 @@ class YouTubeDownloader:
             if not all([parsed_url.scheme, parsed_url.netloc]):
                 return False, "Invalid URL format"
                 
-            # Check if it's a YouTube domain
-            if not any(domain in parsed_url.netloc for domain in ["youtube.com", "youtu.be", "youtube", "ytimg.com"]):
+            # Check if it's a YouTube domain (not just a host containing one)
+            host = parsed_url.hostname or ""
+            if host not in YOUTUBE_DOMAINS and not host.endswith(YOUTUBE_DOMAIN_SUFFIXES):
                 return False, "URL is not from a recognized YouTube domain"
                 
             # Try to extract video ID as final validation
@@ -111,18 +134,27 @@ class YouTubeDownloader:
         # Extract video ID - support both regular YouTube and Shorts URLs
         video_id = self._extract_video_id(url)
             
+        # Reuse an earlier download of the same video
+        existing = self._find_download(download_dir, video_id)
+        if existing:
+            logger.info(f"Reusing downloaded podcast audio: {existing}")
+            self.metadata = self._read_metadata(download_dir, video_id)
+            return existing
+        
         output_template = str(download_dir / f"podcast_{video_id}.%(ext)s")
         
-        # Configure yt-dlp options for optimal audio quality
+        # Configure yt-dlp to keep YouTube's own audio stream: prefer AAC in
+        # m4a, and extract audio without re-encoding it to another codec
         ydl_opts = {
-            'format': 'bestaudio/best',
+            'format': 'bestaudio[ext=m4a]/bestaudio/best',
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
+                'preferredcodec': 'best',
             }],
             'outtmpl': output_template,
             'noplaylist': True,
+            'concurrent_fragment_downloads': CONCURRENT_FRAGMENTS,
+            'http_chunk_size': HTTP_CHUNK_SIZE,
             'quiet': True,
             'no_warnings': True,
         }
@@ -135,13 +167,10 @@ class YouTubeDownloader:
                 self.metadata = info
             
             # Find the downloaded file
-            expected_output = download_dir / f"podcast_{video_id}.mp3"
-            if expected_output.exists():
-                return expected_output
-                
-            # If the expected output doesn't exist, look for any file that matches the pattern
-            for file in download_dir.glob(f"podcast_{video_id}.*"):
-                return file
+            downloaded = self._find_download(download_dir, video_id)
+            if downloaded:
+                self._write_metadata(download_dir, video_id)
+                return downloaded
                 
             raise FileNotFoundError(f"Downloaded audio file not found for podcast ID: {video_id}")
             
@@ -163,6 +192,48 @@ class YouTubeDownloader:
             logger.error(f"Error downloading podcast audio: {str(e)}")
             raise
     
+    def _find_download(self, download_dir: Path, video_id: str) -> Optional[Path]:
+        """
+        Find the finished audio file downloaded for a video, if any.
+        
+        Args:
+            download_dir: Directory downloads are saved to
+            video_id: YouTube video ID
+            
+        Returns:
+            Path to the audio file, or None
+        """
+        expected_output = download_dir / f"podcast_{video_id}.mp3"
+        if expected_output.exists():
+            return expected_output
+        
+        # Otherwise look for any finished file that matches the pattern
+        for file in download_dir.glob(f"podcast_{video_id}.*"):
+            if not file.name.endswith(METADATA_SUFFIX) and file.suffix not in PARTIAL_SUFFIXES:
+                return file
+        return None
+    
+    def _write_metadata(self, download_dir: Path, video_id: str):
+        """
+        Save the metadata fields used by get_metadata next to the download.
+        """
+        try:
+            metadata = {field: self.metadata.get(field) for field in METADATA_FIELDS}
+            with open(download_dir / f"podcast_{video_id}{METADATA_SUFFIX}", "w", encoding="utf-8") as f:
+                json.dump(metadata, f)
+        except Exception as e:
+            logger.warning(f"Failed to save metadata for {video_id}: {str(e)}")
+    
+    def _read_metadata(self, download_dir: Path, video_id: str) -> dict:
+        """
+        Load the metadata saved with an earlier download (empty if there is none).
+        """
+        try:
+            with open(download_dir / f"podcast_{video_id}{METADATA_SUFFIX}", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
     def _extract_video_id(self, url: str) -> str:
         """
         Extract YouTube video ID from URL supporting various formats.
@@ -173,22 +244,12 @@ class YouTubeDownloader:
         Returns:
             YouTube video ID
         """
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/|youtube\.com\/v\/|youtube\.com\/e\/|youtube\.com\/user\/.*\/.*\/|youtube\.com\/user\/.*\?v=|youtube\.com\/shorts\/|youtube\.com\/live\/|youtube\.com\/\?v=|youtube\.com\/watch\?.*v=)([^&\n?#]+)',
-            r'(?:youtu\.be\/|youtube\.com\/embed\/|youtube\.com\/shorts\/)([^&\n?#]+)',
-        ]
+        match = VIDEO_ID_PATTERN.search(url)
+        if match:
+            return match.group("id") or match.group("bare")
         
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        
-        # If URL doesn't match pattern, assume it's a video ID or generate hash
-        if re.match(r'^[A-Za-z0-9_-]{11}$', url):
-            return url
-        else:
-            # Use a hash of the URL as fallback
-            return hashlib.md5(url.encode()).hexdigest()[:11]
+        # Use a hash of the URL as fallback
+        return hashlib.blake2b(url.encode(), digest_size=8).hexdigest()[:11]
     
     def get_metadata(self) -> dict:
         """
@@ -252,3 +313,16 @@ class YouTubeDownloader:
                 "error": str(e),
                 "file_path": None
             } 
+    
+    async def download_audio_async(self, url: str) -> Dict:
+        """
+        Run download_audio in a worker thread so the event loop stays free
+        while yt-dlp downloads.
+        
+        Args:
+            url: YouTube URL of the video
+            
+        Returns:
+            Dictionary containing file_path and metadata
+        """
+        return await asyncio.to_thread(self.download_audio, url)